@@ -4,56 +4,335 @@ import os
 from pathlib import Path
 import zipfile
 import time
+import json
+import hashlib
 import io
-import winreg
+import struct
+import zlib
+import re
+from datetime import datetime
+import shutil
+import tempfile
+import threading
+import random
+import copy
+import errno
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from urllib.parse import urlsplit
 
 REQUIRED_PACKAGES = ["requests", "rich", "questionary"]
 
 def check_and_install_dependencies():
-    print("Checking dependencies...")
-    missing = []
+    import importlib.util
     
-    for package in REQUIRED_PACKAGES:
-        try:
-            __import__(package)
-        except ImportError:
-            missing.append(package)
+    # find_spec only looks the packages up, nothing is imported until it's used
+    missing = [package for package in REQUIRED_PACKAGES if importlib.util.find_spec(package) is None]
     
     if missing:
         print(f"Installing: {', '.join(missing)}")
         subprocess.check_call([sys.executable, "-m", "pip", "install"] + missing)
         print("Done")
-    else:
-        print("All dependencies installed")
-
-check_and_install_dependencies()
-
-import requests
-from rich.console import Console
-from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn
-from rich.prompt import Prompt
-import questionary
-from questionary import Style
-
-console = Console()
-
-custom_style = Style([
-    ('qmark', 'fg:#673ab7 bold'),
-    ('question', 'bold'),
-    ('answer', 'fg:#f44336 bold'),
-    ('pointer', 'fg:#673ab7 bold'),
-    ('highlighted', 'fg:#673ab7 bold'),
-    ('selected', 'fg:#cc5454'),
-    ('separator', 'fg:#cc5454'),
-    ('instruction', 'fg:#000000'),
-    ('text', ''),
-    ('disabled', 'fg:#858585 italic')
-])
+
+
+class LazyConsole:
+    # rich is only imported the first time something is printed
+    def __init__(self):
+        self._console = None
+    
+    def get(self):
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
+    
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+console = LazyConsole()
+
+
+@contextmanager
+def progress_display(progress, *columns):
+    # Concurrent installs share one live display, rich only allows one at a time
+    if progress is not None:
+        yield progress
+        return
+    
+    from rich.progress import Progress
+    
+    with Progress(*columns, console=console.get()) as progress:
+        yield progress
+
+_custom_style = None
+
+
+def get_custom_style():
+    global _custom_style
+    
+    if _custom_style is None:
+        from questionary import Style
+        _custom_style = Style([
+            ('qmark', 'fg:#673ab7 bold'),
+            ('question', 'bold'),
+            ('answer', 'fg:#f44336 bold'),
+            ('pointer', 'fg:#673ab7 bold'),
+            ('highlighted', 'fg:#673ab7 bold'),
+            ('selected', 'fg:#cc5454'),
+            ('separator', 'fg:#cc5454'),
+            ('instruction', 'fg:#000000'),
+            ('text', ''),
+            ('disabled', 'fg:#858585 italic')
+        ])
+    
+    return _custom_style
+
+
+class Tracer:
+    # Opt-in spans for each install stage and package, written as a Chrome trace
+    # (chrome://tracing or ui.perfetto.dev) plus a summary table
+    def __init__(self):
+        self.enabled = False
+        self.profile_mode = None
+        self.profile_path = None
+        self.tracing = 0
+        self.spans = []
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+    
+    def enable(self, profile_mode=None, profile_path=None):
+        self.enabled = True
+        self.profile_mode = profile_mode
+        self.profile_path = profile_path
+        self.spans = []
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def span(self, name, **attrs):
+        if not self.enabled:
+            yield attrs
+            return
+        
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.spans.append({
+                    "name": name,
+                    "start": start - self.started,
+                    "duration": end - start,
+                    "thread": threading.current_thread().name,
+                    "attrs": attrs
+                })
+    
+    @contextmanager
+    def profile(self, name, tag=None):
+        # Installs running side by side each profile their own thread into
+        # their own file, tagged with the binary type
+        if not self.enabled or not self.profile_mode:
+            yield
+            return
+        
+        if self.profile_mode == "cprofile":
+            import cProfile
+            import pstats
+            
+            path = Path(self.profile_path or f"{name}.prof")
+            if tag:
+                path = path.with_name(f"{path.stem}-{tag}{path.suffix}")
+            
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ profiles every thread from one profiler and only allows one
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(str(path))
+                console.print(f"\n[dim]cProfile for {name} saved to {path}[/dim]")
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        else:
+            import tracemalloc
+            
+            # tracemalloc is process-wide, so the first one in starts it and the
+            # last one out reports for all of them
+            with self.lock:
+                self.tracing += 1
+                if self.tracing == 1:
+                    tracemalloc.start()
+            try:
+                yield
+            finally:
+                with self.lock:
+                    self.tracing -= 1
+                    last = not self.tracing
+                    if last:
+                        snapshot = tracemalloc.take_snapshot()
+                        _, peak = tracemalloc.get_traced_memory()
+                        tracemalloc.stop()
+                if last:
+                    console.print(f"\n[dim]tracemalloc for {name}: peak {format_size(peak)}[/dim]")
+                    for stat in snapshot.statistics("lineno")[:10]:
+                        console.print(f"[dim]  {stat}[/dim]")
+    
+    def summary(self):
+        stages = {}
+        
+        for span in self.spans:
+            stage = stages.setdefault(span["name"], {
+                "count": 0, "seconds": 0.0, "bytes": 0, "retries": 0, "cache_hits": 0, "cache_misses": 0
+            })
+            attrs = span["attrs"]
+            stage["count"] += 1
+            stage["seconds"] += span["duration"]
+            stage["bytes"] += attrs.get("bytes", 0)
+            stage["retries"] += attrs.get("retries", 0)
+            stage["cache_hits"] += attrs.get("cache") == "hit"
+            stage["cache_misses"] += attrs.get("cache") == "miss"
+        
+        return stages
+    
+    def write(self, path):
+        threads = {}
+        events = []
+        
+        for span in self.spans:
+            events.append({
+                "name": span["attrs"].get("package", span["name"]),
+                "cat": span["name"],
+                "ph": "X",
+                "ts": round(span["start"] * 1e6),
+                "dur": round(span["duration"] * 1e6),
+                "pid": os.getpid(),
+                "tid": threads.setdefault(span["thread"], len(threads)),
+                "args": span["attrs"]
+            })
+        
+        for thread_name, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                           "args": {"name": thread_name}})
+        
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "otherData": {"summary": self.summary()}}, f, indent=1)
+    
+    def print_summary(self):
+        from rich.table import Table
+        
+        table = Table(title="Install trace")
+        for column in ["Stage", "Count", "Time", "Bytes", "Throughput", "Retries", "Cache hit/miss"]:
+            table.add_column(column, justify="left" if column == "Stage" else "right")
+        
+        for name, stage in self.summary().items():
+            throughput = f"{format_size(stage['bytes'] / stage['seconds'])}/s" \
+                if stage["bytes"] and stage["seconds"] else "-"
+            table.add_row(
+                name,
+                str(stage["count"]),
+                f"{stage['seconds']:.2f}s",
+                format_size(stage["bytes"]) if stage["bytes"] else "-",
+                throughput,
+                str(stage["retries"]),
+                f"{stage['cache_hits']}/{stage['cache_misses']}"
+            )
+        
+        console.print(table)
+
+
+tracer = Tracer()
 
 CDN_BASE = "https://setup-aws.rbxcdn.com"
 DEPLOY_HISTORY_URL = "https://setup.rbxcdn.com/DeployHistory.txt"
 
+# Tried after CDN_BASE, fastest first once they've been probed
+CDN_MIRRORS = [
+    "https://setup-ak.rbxcdn.com",
+    "https://setup-cfly.rbxcdn.com",
+    "https://setup.rbxcdn.com"
+]
+MIRROR_PROBE_TIMEOUT = 5
+
+# Set to a serve-cache URL to fetch everything through a LAN cache instead
+CACHE_SERVER = os.environ.get("WEAO_CACHE_SERVER")
+PROXY_CACHE_DIR = Path("downloads") / "proxy"
+MANIFEST_CACHE_DIR = Path("downloads") / "manifests"
+WATCH_INTERVAL = 60
+WATCH_WORKERS = 2
+PROXY_PATH_PATTERN = re.compile(r"^/(?P<version>version-[0-9a-zA-Z]+)-(?P<name>[^/]+)$")
+DOWNLOAD_TIMEOUT = (10, 30)
+
+DEPLOY_HISTORY_CACHE = Path("downloads") / "DeployHistory.txt"
+DEPLOY_HISTORY_MAX_AGE = 60
+DEPLOY_HISTORY_OVERLAP = 256
+VERSION_PAGE_SIZE = 15
+
+DOWNLOAD_WORKERS = 8
+MAX_DOWNLOAD_WORKERS = 32
+ADAPTIVE_CONCURRENCY = True
+THROUGHPUT_SAMPLE_INTERVAL = 1.0
+MEMORY_CEILING = 64 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+# Both come out of MEMORY_CEILING, the rest of it is for spooling downloads
+PIPELINE_QUEUE_BYTES = MEMORY_CEILING // 4
+
+UNPACK_WORKERS = os.cpu_count() or 4
+UNPACK_WINDOW_BYTES = MEMORY_CEILING // 4
+
+EXTRACT_WORKERS = min(8, os.cpu_count() or 4)
+EXTRACT_BUFFER_SIZE = 4 * 1024 * 1024
+
+PACKAGE_CACHE_DIR = Path("downloads") / "packages"
+PACKAGE_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+
+PACKAGE_RETRIES = 5
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_CAP = 15
+
+RESUME_DOWNLOADS = True
+PARTIAL_DOWNLOAD_DIR = Path("downloads") / "partial"
+
+DELTA_INSTALL = True
+INSTALL_RECORD_NAME = "WEAO-Install.json"
+INSTALL_INDEX_NAME = "WEAO-Versions.json"
+
+# Free space kept in reserve on top of what an install is expected to need
+PREFLIGHT_HEADROOM = 256 * 1024 * 1024
+# Smaller files aren't worth the extra system call
+PREALLOCATE_MIN_BYTES = 1024 * 1024
+
+BUNDLE_MAGIC = b"WEAOBND1"
+BUNDLE_ALIGNMENT = 4096
+
+LAUNCHERS = {
+    "WindowsPlayer": "RobloxPlayerBeta.exe",
+    "WindowsStudio64": "RobloxStudioBeta.exe"
+}
+
+# Both live inside Versions so moving a folder in or out is a rename on the same drive
+STAGING_PREFIX = ".staging-"
+GRAVEYARD_NAME = ".graveyard"
+# Held by the install building a staging folder, which other processes leave alone
+STAGING_LOCK_NAME = ".staging.lock"
+STAGING_STALE_AGE = 60
+
+# Off by default: version folders become hardlinks into one store of unique files
+FILE_STORE = False
+FILE_STORE_NAME = ".store"
+ROBLOX_PROCESSES = ["RobloxPlayerBeta.exe", "RobloxStudioBeta.exe", "weblauncher.exe"]
+PROCESS_EXIT_TIMEOUT = 10
+RENAME_TIMEOUT = 5
+
 EXTRACT_ROOTS_PLAYER = {
     "RobloxApp.zip": "",
     "redist.zip": "",
@@ -118,229 +397,2430 @@ EXTRACT_ROOTS_STUDIO = {
     "studiocontent-textures.zip": "StudioContent/textures/"
 }
 
+_sessions = {}
+_sessions_lock = threading.Lock()
 
-def parse_deploy_history(binary_type, max_versions=15):
-    response = requests.get(DEPLOY_HISTORY_URL)
-    response.raise_for_status()
+
+def get_session(url, pool_size=MAX_DOWNLOAD_WORKERS):
+    host = urlsplit(url).netloc
     
-    lines = response.text.strip().split("\n")
-    target_type = "WindowsPlayer" if binary_type == "WindowsPlayer" else "Studio64"
-    versions = []
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            import requests
+            
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+    
+    return session
+
+
+def format_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+def preallocate(fd, size):
+    # Reserving the whole file before writing lets the filesystem place it in one piece
+    if size < PREALLOCATE_MIN_BYTES:
+        return
+    
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    except OSError as e:
+        # Some filesystems can't do it, which only costs the optimisation
+        if e.errno == errno.ENOSPC:
+            raise
+
+
+class FileLock:
+    # An exclusive lock other processes can see. The OS drops it if the holder crashes.
+    def __init__(self, path, create=True):
+        self.path = Path(path)
+        self.create = create
+        self.file = None
     
-    for line in reversed(lines[-200:]):
-        if f"New {target_type}" in line and "version-" in line:
+    def acquire(self, blocking=True):
+        try:
+            self.file = open(self.path, "a+b" if self.create else "r+b")
+        except FileNotFoundError:
+            return False
+        
+        delay = 0.01
+        while True:
             try:
-                parts = line.split("version-")
-                if len(parts) > 1:
-                    version_hash = "version-" + parts[1].split()[0]
-                    
-                    date_str = ""
-                    if " at " in line:
-                        date_part = line.split(" at ")[1].split(",")[0].strip()
-                        date_str = date_part
-                    
-                    if version_hash not in [v["hash"] for v in versions]:
-                        versions.append({
-                            "hash": version_hash,
-                            "date": date_str,
-                            "raw_line": line
-                        })
-                        
-                        if len(versions) >= max_versions:
-                            break
-            except:
-                continue
+                if os.name == "nt":
+                    import msvcrt
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                if not blocking:
+                    self.file.close()
+                    self.file = None
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 0.25)
     
-    return versions
+    def release(self):
+        if self.file is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self.file = None
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
 
 
-def get_version_from_history(version_mode, binary_type):
-    console.print("[cyan]Getting version...[/cyan]")
-    versions = parse_deploy_history(binary_type, max_versions=15)
+class PackageCache:
+    def __init__(self, root=PACKAGE_CACHE_DIR, max_bytes=PACKAGE_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
     
-    if not versions:
-        raise ValueError("Could not find version in deploy history")
+    def path(self, checksum):
+        return self.root / f"{checksum.lower()}.zip"
     
-    if version_mode == "1":
-        version_hash = versions[0]["hash"]
-    elif version_mode == "2":
-        version_hash = versions[2]["hash"] if len(versions) > 2 else versions[-1]["hash"]
-    else:
-        return None
+    def get(self, checksum):
+        path = self.path(checksum)
+        
+        with self.lock:
+            try:
+                # mtime doubles as the last-used time for LRU eviction
+                os.utime(path)
+                self.hits += 1
+                self.bytes_saved += path.stat().st_size
+                return path
+            except FileNotFoundError:
+                self.misses += 1
+                return None
     
-    console.print(f"[green]Version: {version_hash}[/green]")
-    return version_hash
+    def create_temp(self):
+        return tempfile.NamedTemporaryFile(dir=self.root, suffix=".tmp", delete=False)
+    
+    def store(self, checksum, temp_path):
+        path = self.path(checksum)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return path
+    
+    def evict(self, keep=None):
+        with self.lock:
+            entries = []
+            for path in self.root.glob("*.zip"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    path.unlink()
+                    total -= size
+                except OSError:
+                    # Still open by another download on Windows, try again next time
+                    continue
+    
+    def summary(self):
+        summary = f"Cache: {self.hits} hit(s), {self.misses} miss(es), {format_size(self.bytes_saved)} not downloaded"
+        if self.shared:
+            summary += f", {self.shared} package(s) shared between installs"
+        return summary
 
 
-def show_version_list_and_select(binary_type):
-    console.print("\n[cyan]Fetching version history...[/cyan]")
-    versions = parse_deploy_history(binary_type, max_versions=15)
+class PipelineAborted(Exception):
+    pass
+
+
+class ByteQueue:
+    # Bounded by the bytes it holds rather than the number of items. An item
+    # is always let into an empty queue, so one larger than the limit can't stall it.
+    def __init__(self, max_bytes):
+        self.condition = threading.Condition()
+        self.items = deque()
+        self.size = 0
+        self.max_bytes = max_bytes
+        self.error = None
+        self.blocked = 0.0
     
-    if not versions:
-        console.print("[red]No versions found[/red]")
-        return None
+    def put(self, item, size=0):
+        with self.condition:
+            started = time.perf_counter()
+            while self.error is None and self.size and self.size + size > self.max_bytes:
+                self.condition.wait()
+            self.blocked += time.perf_counter() - started
+            if self.error is not None:
+                raise PipelineAborted() from self.error
+            
+            self.items.append((item, size))
+            self.size += size
+            self.condition.notify_all()
     
-    choices = []
-    for version in versions:
-        date_str = version["date"] if version["date"] else "Unknown date"
-        choice_text = f"{version['hash']} - {date_str}"
-        choices.append({
-            "name": choice_text,
-            "value": version["hash"]
-        })
+    def get(self):
+        with self.condition:
+            while self.error is None and not self.items:
+                self.condition.wait()
+            if self.error is not None:
+                raise PipelineAborted() from self.error
+            
+            item, size = self.items.popleft()
+            self.size -= size
+            self.condition.notify_all()
+            return item
     
-    choices.append({"name": "Cancel", "value": None})
+    def abort(self, error):
+        with self.condition:
+            self.error = error
+            self.condition.notify_all()
+
+
+class QueuedMember:
+    def __init__(self, stage, path, file_info):
+        self.stage = stage
+        stage.queue.put(("open", path, file_info))
     
-    selected = questionary.select(
-        "Select a version",
-        choices=choices,
-        style=custom_style,
-        use_shortcuts=False,
-        use_arrow_keys=True,
-        qmark=">"
-    ).ask()
+    def write(self, data):
+        self.stage.queue.put(("write", data), len(data))
     
-    if selected:
-        console.print(f"\n[green]Selected: {selected}[/green]")
+    def __enter__(self):
+        return self
     
-    return selected
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.stage.queue.put(("close",))
 
 
-def download_and_package_roblox(binary_type, version_hash, output_path):
-    console.print("\n[cyan]Fetching manifest...[/cyan]")
+class WriterStage:
+    # Runs every call on the wrapped writer on one thread, in the order they were
+    # made, so disk writes overlap with decompressing the next members. The
+    # queue between them caps how far decompression can run ahead.
+    def __init__(self, writer, max_bytes=PIPELINE_QUEUE_BYTES):
+        self.writer = writer
+        self.queue = ByteQueue(max_bytes)
+        self.busy = 0.0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="package-writer", daemon=True)
+        self.thread.start()
     
-    version_path = f"{CDN_BASE}/{version_hash}-"
-    manifest_url = f"{version_path}rbxPkgManifest.txt"
+    def writestr(self, path, data):
+        self.queue.put(("writestr", path, data), len(data))
     
-    response = requests.get(manifest_url)
+    def open(self, path, file_info):
+        return QueuedMember(self, path, file_info)
     
-    if response.status_code == 403:
-        console.print("[red]Error: Version not available on Roblox CDN[/red]")
-        console.print("[yellow]Only recent versions can be downloaded[/yellow]")
-        raise ValueError("Version not available")
+    def link(self, path, source):
+        self.queue.put(("link", path, source))
     
-    response.raise_for_status()
-    manifest_lines = [line.strip() for line in response.text.split("\n")]
+    def run(self):
+        target = None
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                
+                started = time.perf_counter()
+                operation = item[0]
+                if operation == "open":
+                    target = self.writer.open(item[1], item[2])
+                elif operation == "write":
+                    target.write(item[1])
+                elif operation == "close":
+                    target.__exit__(None, None, None)
+                    target = None
+                elif operation == "writestr":
+                    self.writer.writestr(item[1], item[2])
+                elif operation == "link":
+                    self.writer.link(item[1], item[2])
+                self.busy += time.perf_counter() - started
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self.error = e
+            self.queue.abort(e)
+        finally:
+            # Only left open when the pipeline failed, so the member is discarded
+            if target is not None:
+                target.__exit__(PipelineAborted, PipelineAborted(), None)
     
-    if manifest_lines[0] != "v0":
-        raise ValueError(f"Unknown manifest version: {manifest_lines[0]}")
+    def finish(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
     
-    is_player = "RobloxApp.zip" in manifest_lines
-    extract_roots = EXTRACT_ROOTS_PLAYER if is_player else EXTRACT_ROOTS_STUDIO
+    def abort(self, error):
+        self.queue.abort(error)
+        self.thread.join()
+
+
+class SingleFlight:
+    # Concurrent callers asking for the same key wait for the first one's result
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
     
-    packages = [line for line in manifest_lines if line.endswith(".zip")]
+    def do(self, key, function, *args):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        
+        if leader:
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    del self.calls[key]
+        
+        return future.result(), leader
+
+
+class DownloadScheduler:
+    def __init__(self, workers=DOWNLOAD_WORKERS, max_workers=MAX_DOWNLOAD_WORKERS, adaptive=ADAPTIVE_CONCURRENCY):
+        self.condition = threading.Condition()
+        self.adaptive = adaptive
+        self.max_workers = max(workers, max_workers) if adaptive else workers
+        self.limit = workers
+        self.active = 0
+        self.busy = 0.0
+        self.busy_since = None
+        self.waiting = deque()
+        self.peak = workers
+        self.throttles = 0
+        self.sample_bytes = 0
+        self.sample_started = time.perf_counter()
+        self.last_throughput = None
+        self.last_throttle = 0
+        self.slow_start = True
     
-    console.print(f"[green]Found {len(packages)} packages[/green]\n")
+    @contextmanager
+    def slot(self):
+        # Slots are handed out first come first served, so the packages the
+        # repacking is about to wait on aren't overtaken by later ones
+        with self.condition:
+            ticket = object()
+            self.waiting.append(ticket)
+            while self.waiting[0] is not ticket or self.active >= self.limit:
+                self.condition.wait()
+            self.waiting.popleft()
+            self.active += 1
+            if self.active == 1:
+                self.busy_since = time.perf_counter()
+            self.condition.notify_all()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                if self.active == 0:
+                    self.busy += time.perf_counter() - self.busy_since
+                self.condition.notify_all()
     
-    final_zip = zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED)
+    def busy_time(self):
+        # Time with at least one transfer running
+        with self.condition:
+            if self.active:
+                return self.busy + time.perf_counter() - self.busy_since
+            return self.busy
     
-    final_zip.writestr("AppSettings.xml", 
-        '<?xml version="1.0" encoding="UTF-8"?>\n'
-        '<Settings>\n'
-        '    <ContentFolder>content</ContentFolder>\n'
-        '    <BaseUrl>http://www.roblox.com</BaseUrl>\n'
-        '</Settings>\n')
+    def record(self, size):
+        # Doubles until the first sign of saturation, then additive increase
+        # while throughput keeps rising and multiplicative decrease once it falls
+        with self.condition:
+            self.sample_bytes += size
+            elapsed = time.perf_counter() - self.sample_started
+            if not self.adaptive or elapsed < THROUGHPUT_SAMPLE_INTERVAL:
+                return
+            
+            throughput = self.sample_bytes / elapsed
+            if self.last_throughput is None or throughput > self.last_throughput * 1.05:
+                self.set_limit(self.limit * 2 if self.slow_start else self.limit + 1)
+            elif throughput < self.last_throughput * 0.8:
+                self.slow_start = False
+                self.set_limit(int(self.limit * 0.75))
+            else:
+                self.slow_start = False
+            
+            self.last_throughput = throughput
+            self.sample_bytes = 0
+            self.sample_started = time.perf_counter()
     
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        console=console
-    ) as progress:
-        task = progress.add_task("[cyan]Downloading packages...", total=len(packages))
+    def throttle(self):
+        # A burst of failures from one overloaded mirror only halves the limit once
+        with self.condition:
+            self.throttles += 1
+            now = time.perf_counter()
+            if not self.adaptive or now - self.last_throttle < THROUGHPUT_SAMPLE_INTERVAL:
+                return
+            
+            self.last_throttle = now
+            self.slow_start = False
+            self.set_limit(self.limit // 2)
+            self.last_throughput = None
+            self.sample_bytes = 0
+            self.sample_started = now
+    
+    def set_limit(self, limit):
+        self.limit = min(self.max_workers, max(1, limit))
+        self.peak = max(self.peak, self.limit)
+        self.condition.notify_all()
+    
+    def backoff(self, attempt, retry_after=None):
+        # Full jitter keeps retries from many workers from arriving together
+        delay = random.uniform(0, min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, min(retry_after, RETRY_BACKOFF_CAP))
+        return delay
+    
+    def summary(self):
+        summary = f"Concurrency: {self.limit} (peak {self.peak})"
+        if self.throttles:
+            summary += f", throttled {self.throttles} time(s)"
+        return summary
+
+
+def is_throttle_error(error):
+    # 429, 5xx, resets and stalls mean the link or the mirror is overloaded
+    import requests
+    
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+class CorruptPackageError(ValueError):
+    pass
+
+
+class DownloadStopped(Exception):
+    pass
+
+
+def stream_to_file(response, target, md5, stopped=None, scheduler=None):
+    # Hashing happens in the same pass as the write, so verification costs no extra read
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if stopped and stopped():
+            raise DownloadStopped("Download stopped")
+        md5.update(chunk)
+        target.write(chunk)
+        if scheduler:
+            scheduler.record(len(chunk))
+
+
+def hash_file(path, md5=None):
+    md5 = md5 or hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5
+
+
+def verify_package(package, size, md5):
+    if package.get("packed_size") and size != package["packed_size"]:
+        raise CorruptPackageError(f"{package['name']}: got {size} bytes, expected {package['packed_size']}")
+    
+    if package.get("checksum") and md5.hexdigest() != package["checksum"]:
+        raise CorruptPackageError(f"{package['name']}: MD5 mismatch")
+
+
+class DownloadJournal:
+    def __init__(self, root=PARTIAL_DOWNLOAD_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.path = self.root / "journal.json"
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.parent = None
+        self.used = set()
+        self.entries = self.load()
+    
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    @contextmanager
+    def locked(self):
+        # A watch process and installs can share the journal, so every change
+        # starts from what is on disk and is written back under a file lock
+        with self.lock, FileLock(self.root / "journal.lock"):
+            entries = self.load()
+            self.entries.clear()
+            self.entries.update(entries)
+            yield self.entries
+    
+    def key(self, package_url, package):
+        if package.get("checksum"):
+            return package["checksum"]
+        return urlsplit(package_url).path.strip("/").split("/")[-1]
+    
+    def part_path(self, key):
+        return self.root / f"{key}.part"
+    
+    def part_lock(self, key):
+        # Held while a part is downloaded, so two processes never write the same one
+        return FileLock(self.root / f"{key}.lock")
+    
+    def update(self, key, **values):
+        with self.locked() as entries:
+            entries.setdefault(key, {}).update(values)
+            self.save()
+    
+    def forget(self, key):
+        with self.locked() as entries:
+            entries.pop(key, None)
+            self.save()
+        
+        try:
+            self.part_path(key).unlink()
+        except FileNotFoundError:
+            pass
+    
+    def save(self):
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(temp_path, self.path)
+    
+    def fork(self):
+        # Shares the entries with this journal but can be stopped on its own, so
+        # one failing install doesn't stop the others running next to it
+        journal = copy.copy(self)
+        journal.stopped = threading.Event()
+        journal.parent = self
+        journal.used = set()
+        return journal
+    
+    def release(self):
+        # A fork that finished hands its parts back, to be forgotten when the parent finishes
+        if self.parent is not None:
+            self.parent.used.update(self.used)
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def is_stopped(self):
+        return self.stopped.is_set() or (self.parent is not None and self.parent.is_stopped())
+    
+    def finish(self):
+        for key in self.used:
+            # Parts another process is still downloading are left to it
+            lock = self.part_lock(key)
+            if lock.acquire(blocking=False):
+                try:
+                    self.forget(key)
+                finally:
+                    lock.release()
+                # A process that grabs it in between still gets a verified package,
+                # at worst after one MD5 mismatch and a retry
+                try:
+                    lock.path.unlink()
+                except OSError:
+                    pass
+        
+        with self.locked() as entries:
+            if not entries:
+                try:
+                    self.path.unlink()
+                except FileNotFoundError:
+                    pass
+    
+    def download(self, package_url, package, scheduler=None):
+        try:
+            return self._download(package_url, package, scheduler)
+        except FileNotFoundError:
+            # The part was taken over by another process, so start it again
+            self.forget(self.key(package_url, package))
+            return self._download(package_url, package, scheduler)
+    
+    def _download(self, package_url, package, scheduler=None):
+        key = self.key(package_url, package)
+        part_path = self.part_path(key)
+        expected_size = package.get("packed_size") or None
+        self.used.add(key)
+        
+        with self.locked() as entries:
+            entry = dict(entries.get(key, {}))
+        
+        offset = part_path.stat().st_size if entry and part_path.exists() else 0
+        
+        if entry.get("complete") and offset and offset == (expected_size or offset):
+            return part_path
+        
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            # ETags differ between mirrors, the final MD5 check covers a switch
+            if entry.get("etag") and urlsplit(entry.get("url", "")).netloc == urlsplit(package_url).netloc:
+                headers["If-Range"] = entry["etag"]
+        
+        with get_session(package_url).get(package_url, headers=headers, stream=True,
+                                          timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status_code == 416 and offset and offset == (expected_size or offset):
+                md5 = hash_file(part_path)
+            elif response.status_code == 416 and offset:
+                # The part is longer than the package can be, so it is not worth resuming
+                self.forget(key)
+                return self._download(package_url, package, scheduler)
+            else:
+                response.raise_for_status()
+                
+                # Anything but a 206 picking up exactly where we stopped means the
+                # server is sending the whole body again
+                resumed = response.status_code == 206 and \
+                    response.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+                
+                self.update(key, url=package_url, etag=response.headers.get("ETag"),
+                            size=expected_size, complete=False)
+                
+                # Only the bytes kept from an earlier run need to be hashed from disk
+                md5 = hash_file(part_path) if resumed else hashlib.md5()
+                
+                with open(part_path, "ab" if resumed else "wb") as f:
+                    stream_to_file(response, f, md5, self.is_stopped, scheduler)
+        
+        try:
+            verify_package(package, part_path.stat().st_size, md5)
+        except CorruptPackageError:
+            self.forget(key)
+            raise
+        
+        # Only verified parts are ever marked complete
+        self.update(key, complete=True)
+        return part_path
+
+
+def fetch_package(package_urls, package, spool_size=MEMORY_CEILING, cache=None, journal=None, shared=None,
+                  scheduler=None):
+    checksum = package.get("checksum")
+    
+    with tracer.span("download", package=package["name"], retries=0, failovers=0) as span:
+        if cache and checksum:
+            cached_path = cache.get(checksum)
+            if cached_path:
+                span["cache"] = "hit"
+                return open(cached_path, "rb")
+            span["cache"] = "miss"
+            
+            if shared:
+                # Another install may already be downloading this exact package,
+                # in which case we wait for it to land in the cache instead
+                def download_to_cache():
+                    with download_with_retries(package_urls, package, spool_size, cache, journal, scheduler, span) as f:
+                        return f.name
+                
+                while True:
+                    try:
+                        cached_path, leader = shared.do(checksum, download_to_cache)
+                        break
+                    except DownloadStopped:
+                        # The install downloading it was stopped, which says nothing about this one
+                        if journal is None or journal.is_stopped():
+                            raise
+                if not leader:
+                    span["cache"] = "shared"
+                    with cache.lock:
+                        cache.shared += 1
+                return open(cached_path, "rb")
+        
+        return download_with_retries(package_urls, package, spool_size, cache, journal, scheduler, span)
+
+
+def download_with_retries(package_urls, package, spool_size, cache, journal, scheduler, span):
+    import requests
+    
+    scheduler = scheduler or DownloadScheduler(adaptive=False)
+    
+    # Every failure moves the package on to the next mirror. With the journal on,
+    # the bytes already received are kept and the next mirror continues from there.
+    attempts = max(PACKAGE_RETRIES, len(package_urls))
+    
+    for attempt in range(attempts):
+        package_url = package_urls[attempt % len(package_urls)]
+        span["mirror"] = urlsplit(package_url).netloc
         
-        for package_name in packages:
-            progress.update(task, description=f"[cyan]{package_name}")
+        try:
+            with scheduler.slot():
+                package_file = download_package(package_url, package, spool_size, cache, journal, scheduler)
+            span["bytes"] = package.get("packed_size", 0)
+            return package_file
+        except (CorruptPackageError, requests.RequestException) as e:
+            if attempt + 1 == attempts:
+                raise
             
-            package_url = version_path + package_name
-            response = requests.get(package_url)
-            response.raise_for_status()
+            span["retries"] += 1
+            next_url = package_urls[(attempt + 1) % len(package_urls)]
+            if next_url != package_url:
+                span["failovers"] += 1
+            
+            # Only overload backs off, a 403/404 on one mirror just moves on to the next
+            delay = 0
+            if is_throttle_error(e):
+                scheduler.throttle()
+                delay = scheduler.backoff(attempt, retry_after(e))
+            
+            # Corrupt package errors already name the package
+            if isinstance(e, CorruptPackageError):
+                reason = e
+            elif isinstance(e, requests.HTTPError):
+                reason = f"{package['name']}: HTTP {e.response.status_code}"
+            else:
+                reason = f"{package['name']}: {e}"
+            console.print(f"[yellow]{reason}, retrying from {urlsplit(next_url).netloc}"
+                          f"{f' in {delay:.1f}s' if delay else ''}[/yellow]")
+            time.sleep(delay)
+
+
+def open_cached(cache, checksum):
+    try:
+        return open(cache.path(checksum), "rb")
+    except FileNotFoundError:
+        return None
+
+
+def download_package(package_url, package, spool_size=MEMORY_CEILING, cache=None, journal=None, scheduler=None):
+    checksum = package.get("checksum")
+    
+    if journal:
+        key = journal.key(package_url, package)
+        with journal.part_lock(key):
+            # Another process may have finished it while this one waited for the
+            # lock, or between two retries
+            if cache and checksum:
+                package_file = open_cached(cache, checksum)
+                if package_file:
+                    return package_file
             
-            extract_root = extract_roots.get(package_name, "")
+            part_path = journal.download(package_url, package, scheduler)
             
-            package_zip = zipfile.ZipFile(io.BytesIO(response.content))
-            for file_info in package_zip.filelist:
-                if not file_info.filename.endswith("/"):
-                    file_data = package_zip.read(file_info.filename)
-                    fixed_path = file_info.filename.replace("\\", "/")
-                    final_zip.writestr(extract_root + fixed_path, file_data)
-            package_zip.close()
+            if cache and checksum:
+                cached_path = cache.store(checksum, part_path)
+                journal.forget(key)
+                return open(cached_path, "rb")
             
-            progress.advance(task)
+            return open(part_path, "rb")
+    
+    if cache and checksum:
+        # Checked again on every retry, another process may have downloaded it by now
+        cached_file = open_cached(cache, checksum)
+        if cached_file:
+            return cached_file
+        package_file = cache.create_temp()
+        preallocate(package_file.fileno(), package.get("packed_size", 0))
+    else:
+        # Small packages stay in memory, anything past spool_size rolls over to disk
+        package_file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        if not hasattr(package_file, "seekable"):
+            package_file.seekable = lambda: True
+    
+    try:
+        with get_session(package_url).get(package_url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            md5 = hashlib.md5()
+            stream_to_file(response, package_file, md5, scheduler=scheduler)
+        
+        verify_package(package, package_file.tell(), md5)
+    except BaseException:
+        package_file.close()
+        if cache and checksum:
+            os.remove(package_file.name)
+        raise
+    
+    if cache and checksum:
+        package_file.close()
+        return open(cache.store(checksum, package_file.name), "rb")
+    
+    package_file.seek(0)
+    return package_file
+
+
+def parse_package_manifest(manifest_text):
+    manifest_lines = [line.strip() for line in manifest_text.split("\n")]
+    
+    if manifest_lines[0] != "v0":
+        raise ValueError(f"Unknown manifest version: {manifest_lines[0]}")
+    
+    # Each package name is followed by its MD5, packed size and unpacked size
+    packages = []
+    for index, line in enumerate(manifest_lines):
+        if not line.endswith(".zip"):
+            continue
+        
+        try:
+            checksum = manifest_lines[index + 1].lower()
+            packed_size = int(manifest_lines[index + 2])
+            size = int(manifest_lines[index + 3])
+        except (IndexError, ValueError):
+            checksum, packed_size, size = None, 0, 0
+        
+        packages.append({
+            "name": line,
+            "checksum": checksum,
+            "packed_size": packed_size,
+            "size": size
+        })
+    
+    return packages
+
+
+class MirrorRanking:
+    def __init__(self, mirrors):
+        self.lock = threading.Lock()
+        self.mirrors = list(mirrors)
+        self.latencies = {}
+        self.failed = []
+    
+    def record(self, mirror, latency=None):
+        with self.lock:
+            if latency is None:
+                self.failed.append(mirror)
+            else:
+                self.latencies[mirror] = latency
+    
+    def ranked(self):
+        # Fastest responders first, then mirrors still being probed, failures last
+        with self.lock:
+            fastest = sorted(self.latencies, key=self.latencies.get)
+            pending = [mirror for mirror in self.mirrors if mirror not in self.latencies and mirror not in self.failed]
+            return fastest + pending + list(self.failed)
+
+
+_manifests = {}
+_mirror_rankings = {}
+
+
+def get_mirrors():
+    return [CDN_BASE] + [mirror for mirror in CDN_MIRRORS if mirror != CDN_BASE]
+
+
+def get_package_urls(version_hash, package_name):
+    ranking = _mirror_rankings.get(version_hash)
+    mirrors = ranking.ranked() if ranking else get_mirrors()
+    return [f"{mirror}/{version_hash}-{package_name}" for mirror in mirrors]
+
+
+def manifest_cache_path(version_hash):
+    return MANIFEST_CACHE_DIR / f"{version_hash}-rbxPkgManifest.txt"
+
+
+def fetch_manifest(version_hash, pool_size=MAX_DOWNLOAD_WORKERS):
+    # Manifests never change for a given version, so each is fetched once and kept on disk
+    if version_hash not in _manifests:
+        manifest_path = manifest_cache_path(version_hash)
+        try:
+            text = manifest_path.read_bytes().decode("utf-8")
+            parse_package_manifest(text)
+        except (OSError, ValueError):
+            # A copy that does not parse came from a bad response, never trust it again
+            try:
+                manifest_path.unlink()
+            except FileNotFoundError:
+                pass
+            
+            text = _fetch_manifest(version_hash, pool_size)
+            # Captive portals and error pages can still answer 200, so only a
+            # manifest that parses is ever written to disk
+            parse_package_manifest(text)
+            
+            manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = manifest_path.with_name(f"{manifest_path.name}.{os.urandom(4).hex()}.tmp")
+            temp_path.write_bytes(text.encode("utf-8"))
+            os.replace(temp_path, manifest_path)
+        else:
+            # Fetching the manifest is what ranks the mirrors, so without it they're probed instead
+            rank_mirrors(version_hash, pool_size)
+        
+        _manifests[version_hash] = text
+    return _manifests[version_hash]
+
+
+def probe_mirror(mirror, version_hash, pool_size, ranking, method="GET"):
+    import requests
+    
+    manifest_url = f"{mirror}/{version_hash}-rbxPkgManifest.txt"
+    started = time.perf_counter()
+    
+    try:
+        response = get_session(manifest_url, pool_size).request(method, manifest_url, timeout=MIRROR_PROBE_TIMEOUT)
+    except requests.RequestException as e:
+        ranking.record(mirror)
+        return mirror, None, e
+    
+    ranking.record(mirror, time.perf_counter() - started if response.status_code == 200 else None)
+    return mirror, response, None
+
+
+def rank_mirrors(version_hash, pool_size=MAX_DOWNLOAD_WORKERS):
+    mirrors = get_mirrors()
+    ranking = _mirror_rankings[version_hash] = MirrorRanking(mirrors)
+    if len(mirrors) < 2:
+        return
+    
+    # Same race as _fetch_manifest, but HEAD only: waits for the fastest mirror
+    # and leaves the others ranking themselves in the background
+    with tracer.span("rank_mirrors", version=version_hash) as span:
+        executor = ThreadPoolExecutor(max_workers=len(mirrors))
+        futures = [executor.submit(probe_mirror, mirror, version_hash, pool_size, ranking, "HEAD")
+                   for mirror in mirrors]
+        executor.shutdown(wait=False)
+        
+        for future in as_completed(futures):
+            mirror, response, _ = future.result()
+            if response is not None and response.status_code == 200:
+                span["mirror"] = urlsplit(mirror).netloc
+                return
+
+
+def _fetch_manifest(version_hash, pool_size=MAX_DOWNLOAD_WORKERS):
+    mirrors = get_mirrors()
+    ranking = _mirror_rankings[version_hash] = MirrorRanking(mirrors)
+    
+    with tracer.span("manifest", version=version_hash) as span:
+        # Every mirror is asked at once and the first good answer wins. The slower
+        # probes keep running in the background and only affect the ranking.
+        executor = ThreadPoolExecutor(max_workers=len(mirrors))
+        futures = [executor.submit(probe_mirror, mirror, version_hash, pool_size, ranking) for mirror in mirrors]
+        executor.shutdown(wait=False)
+        
+        statuses = []
+        errors = []
+        for future in as_completed(futures):
+            mirror, response, error = future.result()
+            
+            if response is not None and response.status_code == 200:
+                span["mirror"] = urlsplit(mirror).netloc
+                span["bytes"] = len(response.content)
+                return response.text
+            
+            if response is not None:
+                statuses.append(response.status_code)
+                errors.append(f"{urlsplit(mirror).netloc}: HTTP {response.status_code}")
+            else:
+                errors.append(f"{urlsplit(mirror).netloc}: {error}")
+    
+    if 403 in statuses:
+        console.print("[red]Error: Version not available on Roblox CDN[/red]")
+        console.print("[yellow]Only recent versions can be downloaded[/yellow]")
+        raise ValueError("Version not available")
+    
+    raise ValueError("Could not fetch manifest from any mirror: " + "; ".join(errors))
+
+
+APP_SETTINGS_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Settings>\n'
+    '    <ContentFolder>content</ContentFolder>\n'
+    '    <BaseUrl>http://www.roblox.com</BaseUrl>\n'
+    '</Settings>\n'
+)
+
+
+class ZipPackageWriter:
+    def __init__(self, output_path):
+        self.file = open(output_path, "w+b")
+        self.zip = zipfile.ZipFile(self.file, "w", zipfile.ZIP_STORED)
+    
+    def reserve(self, size):
+        preallocate(self.file.fileno(), size)
+    
+    def writestr(self, path, data):
+        self.zip.writestr(path, data)
+    
+    def open(self, path, file_info):
+        member_info = zipfile.ZipInfo(path, file_info.date_time)
+        member_info.file_size = file_info.file_size
+        return self.zip.open(member_info, "w")
+    
+    def link(self, path, source):
+        self.zip.write(source, path)
+    
+    def close(self):
+        try:
+            self.zip.close()
+            # Gives back whatever part of the reservation wasn't used
+            self.file.truncate()
+        finally:
+            self.file.close()
+
+
+class DirectoryPackageWriter:
+    def __init__(self, root, store=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.store = store
+    
+    def target(self, path):
+        # Same sanitising ZipFile.extract applies to member names
+        parts = [part for part in path.split("/") if part not in ("", ".", "..")]
+        return self.root.joinpath(*parts)
+    
+    def writestr(self, path, data):
+        target = self.target(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self.open_target(target) as f:
+            f.write(data)
+    
+    def open(self, path, file_info):
+        target = self.target(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        f = self.open_target(target)
+        preallocate(f.fileno(), file_info.file_size)
+        return f
+    
+    def open_target(self, target):
+        if self.store:
+            return self.store.open(target)
+        
+        # The path may be a hardlink shared with another version, which must not be overwritten
+        if target.exists():
+            target.unlink()
+        return open(target, "wb")
+    
+    def link(self, path, source):
+        target = self.target(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists():
+            target.unlink()
+        
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+    
+    def reserve(self, size):
+        pass
+    
+    def close(self):
+        pass
+
+
+class StoredFile:
+    # Written to a temp file inside the store, then filed under its hash and linked into place
+    def __init__(self, store, target):
+        self.store = store
+        self.target = target
+        self.file = store.create_temp()
+        self.sha256 = hashlib.sha256()
+        with store.lock:
+            store.writing.add(self.file.name)
+    
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+    
+    def fileno(self):
+        return self.file.fileno()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        try:
+            if exc_type is None:
+                self.store.commit(self.file.name, self.sha256.hexdigest(), self.target)
+            else:
+                os.remove(self.file.name)
+        finally:
+            with self.store.lock:
+                self.store.writing.discard(self.file.name)
+
+
+class FileStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.temp_dir = self.root / "tmp"
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.writing = set()
+        self.stored = 0
+        self.reused = 0
+        self.bytes_saved = 0
+    
+    def path(self, digest):
+        return self.root / digest[:2] / digest
+    
+    def create_temp(self):
+        return tempfile.NamedTemporaryFile(dir=self.temp_dir, delete=False)
+    
+    def open(self, target):
+        return StoredFile(self, target)
+    
+    def commit(self, temp_path, digest, target):
+        path = self.path(digest)
+        
+        # Held until the link exists, so collect() can't remove a file that's about to be reused
+        with self.lock:
+            if path.exists():
+                self.reused += 1
+                self.bytes_saved += os.path.getsize(temp_path)
+                os.remove(temp_path)
+            else:
+                path.parent.mkdir(exist_ok=True)
+                os.replace(temp_path, path)
+                self.stored += 1
+            
+            if target.exists():
+                target.unlink()
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+    
+    def link_existing(self, digest, target):
+        path = self.path(digest)
+        with self.lock:
+            if not path.exists():
+                return False
+            if target.exists():
+                target.unlink()
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+            self.reused += 1
+            self.bytes_saved += path.stat().st_size
+            return True
+    
+    def collect(self):
+        # Every version folder using a file adds a hardlink to it, so a file
+        # with a link count of 1 is only referenced by the store itself
+        freed = 0
+        for path in self.root.glob("??/*"):
+            with self.lock:
+                try:
+                    stat = path.stat()
+                    if stat.st_nlink <= 1:
+                        path.unlink()
+                        freed += stat.st_size
+                except OSError:
+                    continue
+        
+        # Temp files nobody is writing were left behind by an interrupted install
+        with self.lock:
+            for temp_path in self.temp_dir.iterdir():
+                if str(temp_path) in self.writing:
+                    continue
+                try:
+                    temp_path.unlink()
+                except OSError:
+                    pass
+        return freed
+    
+    def summary(self):
+        return (f"File store: {self.stored} new file(s), {self.reused} already stored "
+                f"({format_size(self.bytes_saved)} not written)")
+
+
+_file_stores = {}
+_file_stores_lock = threading.Lock()
+
+
+def get_file_store(install_path):
+    # One instance per store, so concurrent installs share its lock
+    with _file_stores_lock:
+        root = Path(install_path) / FILE_STORE_NAME
+        if root not in _file_stores:
+            _file_stores[root] = FileStore(root)
+        return _file_stores[root]
+
+
+class PackageReader:
+    # Reads members straight from their offsets in the package, so several
+    # threads can inflate different members of the same package at once
+    def __init__(self, package_file):
+        self.file = package_file
+        self.lock = threading.Lock()
+        self.pread = isinstance(package_file, io.BufferedReader) and hasattr(os, "pread")
+    
+    @staticmethod
+    def supports(file_info):
+        encrypted = file_info.flag_bits & 0x1
+        return not encrypted and file_info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+    
+    def read(self, offset, size):
+        if self.pread:
+            return os.pread(self.file.fileno(), size, offset)
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(size)
+    
+    def chunks(self, file_info):
+        header = self.read(file_info.header_offset, 30)
+        if header[:4] != b"PK\x03\x04":
+            raise zipfile.BadZipFile(f"Bad local header for {file_info.filename}")
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        
+        offset = file_info.header_offset + 30 + name_length + extra_length
+        remaining = file_info.compress_size
+        decompressor = zlib.decompressobj(-15) if file_info.compress_type == zipfile.ZIP_DEFLATED else None
+        crc = 0
+        
+        while remaining:
+            data = self.read(offset, min(CHUNK_SIZE, remaining))
+            if not data:
+                raise zipfile.BadZipFile(f"{file_info.filename} is truncated")
+            offset += len(data)
+            remaining -= len(data)
+            
+            if not decompressor:
+                crc = zlib.crc32(data, crc)
+                yield data
+                continue
+            
+            # Output is capped per call, highly compressible members would
+            # otherwise inflate a whole chunk into one huge buffer
+            while data:
+                inflated = decompressor.decompress(data, CHUNK_SIZE)
+                data = decompressor.unconsumed_tail
+                crc = zlib.crc32(inflated, crc)
+                if inflated:
+                    yield inflated
+        
+        if decompressor:
+            data = decompressor.flush()
+            crc = zlib.crc32(data, crc)
+            if data:
+                yield data
+        
+        if crc != file_info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for {file_info.filename}")
+    
+    def read_member(self, file_info):
+        return b"".join(self.chunks(file_info))
+
+
+def copy_package_members(package_file, writer, extract_root, workers=UNPACK_WORKERS, advance=None,
+                         window_bytes=UNPACK_WINDOW_BYTES):
+    with zipfile.ZipFile(package_file) as package_zip:
+        members = [file_info for file_info in package_zip.infolist() if not file_info.filename.endswith("/")]
+    
+    if workers > 1 and len(members) > 1 and all(PackageReader.supports(file_info) for file_info in members):
+        return copy_members_parallel(package_file, members, writer, extract_root, workers, advance, window_bytes)
+    
+    written = []
+    
+    with zipfile.ZipFile(package_file) as package_zip:
+        for file_info in members:
+            path = extract_root + file_info.filename.replace("\\", "/")
+            
+            with package_zip.open(file_info) as source, writer.open(path, file_info) as target:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+            written.append(path)
+            if advance:
+                advance(file_info.file_size)
+    
+    return written
+
+
+def copy_members_parallel(package_file, members, writer, extract_root, workers, advance=None,
+                          window_bytes=UNPACK_WINDOW_BYTES):
+    # Members are inflated on a pool up to window_bytes ahead and handed to
+    # the writer in archive order, so the result is the same as the serial copy.
+    # Members too big to hold in memory are streamed when their turn comes.
+    reader = PackageReader(package_file)
+    large_member = window_bytes // 4
+    pending = deque()
+    next_index = 0
+    in_flight = 0
+    written = []
+    
+    def fill():
+        nonlocal next_index, in_flight
+        while next_index < len(members):
+            file_info = members[next_index]
+            if file_info.file_size > large_member:
+                pending.append((file_info, None))
+            elif in_flight and in_flight + file_info.file_size > window_bytes:
+                return
+            else:
+                pending.append((file_info, executor.submit(reader.read_member, file_info)))
+                in_flight += file_info.file_size
+            next_index += 1
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            fill()
+            while pending:
+                file_info, future = pending.popleft()
+                path = extract_root + file_info.filename.replace("\\", "/")
+                
+                with writer.open(path, file_info) as target:
+                    if future is None:
+                        for chunk in reader.chunks(file_info):
+                            target.write(chunk)
+                    else:
+                        data = future.result()
+                        in_flight -= file_info.file_size
+                        fill()
+                        target.write(data)
+                written.append(path)
+                if advance:
+                    advance(file_info.file_size)
+                fill()
+        finally:
+            for _, future in pending:
+                if future:
+                    future.cancel()
+    
+    return written
+
+
+def read_install_record(version_dir):
+    try:
+        with open(Path(version_dir) / INSTALL_RECORD_NAME, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+_install_index_lock = threading.Lock()
+
+
+def index_entry(binary_type, installed_at, version_dir):
+    try:
+        packages = parse_package_manifest((Path(version_dir) / "rbxPkgManifest.txt").read_text())
+    except (OSError, ValueError):
+        packages = []
+    
+    return {
+        "binary_type": binary_type,
+        "installed_at": installed_at,
+        "size": sum(package["size"] for package in packages),
+        "packages": [
+            {"name": package["name"], "checksum": package["checksum"], "size": package["size"]}
+            for package in packages
+        ]
+    }
+
+
+def load_install_index(install_path):
+    try:
+        with open(install_path / INSTALL_INDEX_NAME, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    
+    index = rebuild_install_index(install_path)
+    if install_path.exists():
+        save_install_index(install_path, index)
+    return index
+
+
+def detect_binary_type(version_folder, record=None):
+    record = record or read_install_record(version_folder)
+    if record:
+        return record.get("binary_type")
+    return next((binary_type for binary_type, launcher in LAUNCHERS.items()
+                 if (version_folder / launcher).exists()), None)
+
+
+def rebuild_install_index(install_path):
+    # Covers versions installed before the index existed or by the official launcher
+    index = {"active": {}, "versions": {}}
+    if not install_path.exists():
+        return index
+    
+    for version_folder in install_path.glob("version-*"):
+        record = read_install_record(version_folder)
+        binary_type = detect_binary_type(version_folder, record)
+        installed_at = record.get("installed_at", 0) if record else version_folder.stat().st_mtime
+        
+        if binary_type:
+            index["versions"][version_folder.name] = index_entry(binary_type, installed_at, version_folder)
+    
+    for version_hash, entry in sorted(index["versions"].items(), key=lambda item: item[1]["installed_at"]):
+        index["active"][entry["binary_type"]] = version_hash
+    
+    return index
+
+
+def save_install_index(install_path, index):
+    install_path.mkdir(parents=True, exist_ok=True)
+    index_path = install_path / INSTALL_INDEX_NAME
+    temp_path = index_path.with_suffix(".tmp")
+    temp_path.write_text(json.dumps(index, indent=2), encoding="utf-8")
+    os.replace(temp_path, index_path)
+
+
+@contextmanager
+def update_install_index(install_path):
+    with _install_index_lock:
+        index = load_install_index(install_path)
+        yield index
+        save_install_index(install_path, index)
+
+
+def record_install(install_path, binary_type, version_hash):
+    # A fresh install becomes the active version for its binary type
+    with update_install_index(install_path) as index:
+        index["versions"][version_hash] = index_entry(binary_type, time.time(), install_path / version_hash)
+        index["active"][binary_type] = version_hash
+
+
+def forget_installs(install_path, version_hashes):
+    with update_install_index(install_path) as index:
+        for version_hash in version_hashes:
+            index["versions"].pop(version_hash, None)
+        index["active"] = {binary_type: version_hash for binary_type, version_hash in index["active"].items()
+                           if version_hash in index["versions"]}
+
+
+def installed_versions(binary_type):
+    install_path = get_roblox_install_path(binary_type)
+    if not install_path or not install_path.exists():
+        return []
+    
+    index = load_install_index(install_path)
+    versions = [(version_hash, entry) for version_hash, entry in index["versions"].items()
+                if entry["binary_type"] == binary_type and (install_path / version_hash).is_dir()]
+    return sorted(versions, key=lambda item: item[1]["installed_at"], reverse=True)
+
+
+def get_active_version(binary_type):
+    install_path = get_roblox_install_path(binary_type)
+    if not install_path or not install_path.exists():
+        return None
+    
+    # The active version first, then the newest install whose launcher is still there
+    index = load_install_index(install_path)
+    candidates = [index["active"].get(binary_type)] + [
+        version_hash for version_hash, entry in
+        sorted(index["versions"].items(), key=lambda item: item[1]["installed_at"], reverse=True)
+        if entry["binary_type"] == binary_type
+    ]
+    
+    for version_hash in candidates:
+        if version_hash and (install_path / version_hash / LAUNCHERS[binary_type]).exists():
+            return install_path / version_hash
+    return None
+
+
+def switch_version(binary_type, version_hash):
+    install_path = get_roblox_install_path(binary_type)
+    if not install_path or not (install_path / version_hash / LAUNCHERS[binary_type]).exists():
+        console.print(f"[red]Error: {version_hash} is not installed[/red]")
+        return False
+    
+    with update_install_index(install_path) as index:
+        if version_hash not in index["versions"]:
+            index["versions"][version_hash] = index_entry(binary_type, time.time(), install_path / version_hash)
+        index["active"][binary_type] = version_hash
+    
+    console.print(f"[green]{BINARY_LABELS[binary_type]} now uses {version_hash}[/green]")
+    
+    if binary_type == "WindowsPlayer":
+        return register_protocol_handlers()
+    return True
+
+
+def find_delta_base(install_path, binary_type, version_hash):
+    candidates = []
+    
+    for version_folder in install_path.glob("version-*"):
+        if version_folder.name == version_hash or not version_folder.is_dir():
+            continue
+        
+        record = read_install_record(version_folder)
+        if record and record.get("binary_type") == binary_type:
+            candidates.append((record.get("installed_at", 0), version_folder))
+    
+    return max(candidates)[1] if candidates else None
+
+
+def reusable_packages(packages, base_dir):
+    record = read_install_record(base_dir) if base_dir else None
+    if not record:
+        return {}
+    
+    base_packages = {package["name"]: package for package in record.get("packages", [])}
+    reusable = {}
+    
+    for package in packages:
+        base_package = base_packages.get(package["name"])
+        if not base_package or not package["checksum"] or base_package.get("checksum") != package["checksum"]:
+            continue
+        
+        files = base_package.get("files", [])
+        if all((Path(base_dir) / path).is_file() for path in files):
+            reusable[package["name"]] = files
+    
+    return reusable
+
+
+_deploy_history = {"text": None, "fetched_at": 0}
+
+
+def save_deploy_history(data, response):
+    DEPLOY_HISTORY_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    
+    temp_path = DEPLOY_HISTORY_CACHE.with_suffix(".tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, DEPLOY_HISTORY_CACHE)
+    
+    meta = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "size": len(data)
+    }
+    DEPLOY_HISTORY_CACHE.with_suffix(".json").write_text(json.dumps(meta), encoding="utf-8")
+
+
+def refresh_deploy_history():
+    session = get_session(DEPLOY_HISTORY_URL)
+    
+    try:
+        data = DEPLOY_HISTORY_CACHE.read_bytes()
+        meta = json.loads(DEPLOY_HISTORY_CACHE.with_suffix(".json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        data, meta = None, {}
+    
+    if data and meta.get("size") == len(data):
+        # DeployHistory.txt only ever grows, so ask for the bytes past our copy
+        # plus a little overlap to make sure the two still line up
+        overlap = min(DEPLOY_HISTORY_OVERLAP, len(data))
+        headers = {"Range": f"bytes={len(data) - overlap}-"}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        
+        response = session.get(DEPLOY_HISTORY_URL, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+        
+        if response.status_code == 304:
+            return data
+        
+        if response.status_code == 206 and response.content[:overlap] == data[-overlap:]:
+            data = data + response.content[overlap:]
+            save_deploy_history(data, response)
+            return data
+        
+        if response.status_code == 200:
+            save_deploy_history(response.content, response)
+            return response.content
+    
+    response = session.get(DEPLOY_HISTORY_URL, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    save_deploy_history(response.content, response)
+    return response.content
+
+
+def fetch_deploy_history(max_age=DEPLOY_HISTORY_MAX_AGE):
+    if _deploy_history["text"] is not None and time.time() - _deploy_history["fetched_at"] < max_age:
+        return _deploy_history["text"]
+    
+    with tracer.span("deploy_history") as span:
+        data = refresh_deploy_history()
+        span["bytes"] = len(data)
+    
+    text = data.decode("utf-8", errors="replace")
+    _deploy_history["text"] = text
+    _deploy_history["fetched_at"] = time.time()
+    return text
+
+
+DEPLOY_LINE_PATTERN = re.compile(
+    r"New (?P<type>\w+) (?P<hash>version-[0-9a-zA-Z]+)"
+    r"(?: at (?P<date>\d+/\d+/\d+ \d+:\d+:\d+ [AP]M))?"
+    r"(?:, file version: (?P<version>\d+, \d+, \d+, \d+))?"
+)
+
+_deploy_index = {"text": None, "entries": []}
+
+
+def build_deploy_index(text):
+    entries = []
+    seen = set()
+    
+    # One pass over the whole history, newest deploy first
+    for line in reversed(text.splitlines()):
+        match = DEPLOY_LINE_PATTERN.search(line)
+        if not match:
+            continue
+        
+        key = (match.group("type"), match.group("hash"))
+        if key in seen:
+            continue
+        seen.add(key)
+        
+        date_str = match.group("date") or ""
+        try:
+            timestamp = datetime.strptime(date_str, "%m/%d/%Y %I:%M:%S %p")
+        except ValueError:
+            timestamp = None
+        
+        client_version = match.group("version")
+        entries.append({
+            "type": match.group("type"),
+            "hash": match.group("hash"),
+            "date": date_str,
+            "timestamp": timestamp,
+            "client_version": client_version.replace(", ", ".") if client_version else "",
+            "raw_line": line
+        })
+    
+    return entries
+
+
+def get_deploy_index():
+    text = fetch_deploy_history()
+    
+    if _deploy_index["text"] is not text:
+        _deploy_index["entries"] = build_deploy_index(text)
+        _deploy_index["text"] = text
+    
+    return _deploy_index["entries"]
+
+
+def parse_deploy_history(binary_type, max_versions=15):
+    target_type = "WindowsPlayer" if binary_type == "WindowsPlayer" else "Studio64"
+    versions = [entry for entry in get_deploy_index() if entry["type"] == target_type]
+    
+    return versions[:max_versions] if max_versions else versions
+
+
+def parse_filter_date(value, end=False):
+    if not value:
+        return None
+    
+    date = datetime.strptime(value, "%Y-%m-%d")
+    return date.replace(hour=23, minute=59, second=59) if end else date
+
+
+def filter_versions(versions, query):
+    query = query.strip()
+    if not query:
+        return versions
+    
+    # "2024-01-01..2024-02-01", "2024-01-01.." or "..2024-02-01" select a date range,
+    # anything else matches the start of the client version or part of the hash
+    if ".." in query and re.fullmatch(r"[\d-]*\.\.[\d-]*", query):
+        start_str, end_str = query.split("..")
+        start = parse_filter_date(start_str)
+        end = parse_filter_date(end_str, end=True)
+        
+        return [
+            version for version in versions
+            if version["timestamp"]
+            and (start is None or version["timestamp"] >= start)
+            and (end is None or version["timestamp"] <= end)
+        ]
+    
+    query = query.lower()
+    return [
+        version for version in versions
+        if version["client_version"].startswith(query) or query in version["hash"].lower()
+    ]
+
+
+def get_version_from_history(version_mode, binary_type):
+    console.print("[cyan]Getting version...[/cyan]")
+    versions = parse_deploy_history(binary_type, max_versions=15)
+    
+    if not versions:
+        raise ValueError("Could not find version in deploy history")
+    
+    if version_mode == "1":
+        version_hash = versions[0]["hash"]
+    elif version_mode == "2":
+        version_hash = versions[2]["hash"] if len(versions) > 2 else versions[-1]["hash"]
+    else:
+        return None
+    
+    console.print(f"[green]Version: {version_hash}[/green]")
+    return version_hash
+
+
+def show_version_list_and_select(binary_type):
+    console.print("\n[cyan]Fetching version history...[/cyan]")
+    all_versions = parse_deploy_history(binary_type, max_versions=None)
+    
+    if not all_versions:
+        console.print("[red]No versions found[/red]")
+        return None
+    
+    versions = all_versions
+    query = ""
+    page = 0
+    
+    while True:
+        page_count = max(1, (len(versions) + VERSION_PAGE_SIZE - 1) // VERSION_PAGE_SIZE)
+        page = min(page, page_count - 1)
+        
+        choices = []
+        for version in versions[page * VERSION_PAGE_SIZE:(page + 1) * VERSION_PAGE_SIZE]:
+            date_str = version["date"] if version["date"] else "Unknown date"
+            choice_text = f"{version['hash']} - {date_str}"
+            if version["client_version"]:
+                choice_text += f" ({version['client_version']})"
+            choices.append({
+                "name": choice_text,
+                "value": version["hash"]
+            })
+        
+        if page + 1 < page_count:
+            choices.append({"name": "Next page", "value": "next"})
+        if page > 0:
+            choices.append({"name": "Previous page", "value": "previous"})
+        choices.append({"name": "Filter by date or version", "value": "filter"})
+        if query:
+            choices.append({"name": "Clear filter", "value": "clear"})
+        choices.append({"name": "Cancel", "value": "cancel"})
+        
+        title = f"Select a version (page {page + 1}/{page_count}, {len(versions)} versions"
+        title += f", filter: {query})" if query else ")"
+        
+        import questionary
+        
+        selected = questionary.select(
+            title,
+            choices=choices,
+            style=get_custom_style(),
+            use_shortcuts=False,
+            use_arrow_keys=True,
+            qmark=">"
+        ).ask()
+        
+        if selected == "next":
+            page += 1
+        elif selected == "previous":
+            page -= 1
+        elif selected == "filter":
+            query = questionary.text(
+                "Version (0.600), hash, or dates (2024-01-01..2024-02-01):",
+                style=get_custom_style()
+            ).ask() or ""
+            try:
+                versions = filter_versions(all_versions, query)
+            except ValueError:
+                console.print("[red]Invalid date, use YYYY-MM-DD[/red]")
+                query, versions = "", all_versions
+            page = 0
+        elif selected == "clear":
+            query, versions, page = "", all_versions, 0
+        elif selected and selected != "cancel":
+            console.print(f"\n[green]Selected: {selected}[/green]")
+            return selected
+        else:
+            return None
+
+
+def download_and_package_roblox(binary_type, version_hash, output_path, **options):
+    writer = ZipPackageWriter(output_path)
+    download_roblox_packages(binary_type, version_hash, writer, **options)
+
+
+def download_and_install_roblox(binary_type, version_hash, install_dir, store=None, **options):
+    writer = DirectoryPackageWriter(install_dir, store)
+    download_roblox_packages(binary_type, version_hash, writer, **options)
+
+
+def download_roblox_packages(binary_type, version_hash, writer, workers=DOWNLOAD_WORKERS,
+                             memory_ceiling=MEMORY_CEILING, cache=None, journal=None, base_dir=None,
+                             shared=None, scheduler=None, progress=None, label="",
+                             adaptive=ADAPTIVE_CONCURRENCY):
+    console.print("\n[cyan]Fetching manifest...[/cyan]")
+    
+    # Starts at `workers` parallel downloads and, if adaptive, tunes that to the link
+    owns_scheduler = scheduler is None
+    if scheduler is None:
+        scheduler = DownloadScheduler(workers, adaptive=adaptive)
+    
+    manifest_text = fetch_manifest(version_hash, scheduler.max_workers)
+    packages = parse_package_manifest(manifest_text)
+    package_names = [package["name"] for package in packages]
+    
+    is_player = "RobloxApp.zip" in package_names
+    extract_roots = EXTRACT_ROOTS_PLAYER if is_player else EXTRACT_ROOTS_STUDIO
+    
+    # A cache or journal passed in belongs to the caller, who reports and finishes it
+    owns_cache = cache is None
+    owns_journal = journal is None
+    if cache is None and PACKAGE_CACHE_MAX_BYTES > 0:
+        cache = PackageCache()
+    if journal is None and RESUME_DOWNLOADS:
+        journal = DownloadJournal()
+    elif journal:
+        journal = journal.fork()
+    
+    console.print(f"[green]Found {len(packages)} packages[/green]\n")
+    
+    # Packages whose checksum is unchanged since base_dir was installed are
+    # linked from there instead of downloaded again
+    reusable = reusable_packages(packages, base_dir)
+    if reusable:
+        console.print(f"[green]Reusing {len(reusable)} unchanged package(s) from {Path(base_dir).name}[/green]\n")
+    
+    installed_files = {}
+    
+    # Progress is measured in unpacked bytes, which is what ends up on disk
+    total_bytes = sum(package["size"] for package in packages)
+    writer.reserve(total_bytes)
+    
+    from rich.progress import (SpinnerColumn, BarColumn, TextColumn, DownloadColumn, TransferSpeedColumn,
+                               TimeRemainingColumn)
+    
+    with progress_display(
+        progress,
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TimeRemainingColumn()
+    ) as progress:
+        task = progress.add_task(f"[cyan]{label}Downloading packages...", total=total_bytes or None)
+        
+        def advance(size):
+            progress.advance(task, size)
+        
+        # Downloads run at most `window` packages ahead of the repacking, which
+        # happens in manifest order so later packages still overwrite earlier ones
+        # deterministically. The scheduler decides how many of those actually
+        # transfer at once. The writer queue and the unpack window each take a
+        # quarter of the memory ceiling, and each package in the window gets an
+        # equal share of the rest before it spills to a temp file.
+        window = scheduler.max_workers
+        queue_bytes = unpack_window_bytes = memory_ceiling // 4
+        spool_size = (memory_ceiling - queue_bytes - unpack_window_bytes) // (window + 1)
+        pending = deque(package for package in packages if package["name"] not in reusable)
+        in_flight = deque()
+        
+        def submit_next():
+            package = pending.popleft()
+            future = executor.submit(fetch_package, get_package_urls(version_hash, package["name"]), package,
+                                     spool_size, cache, journal, shared, scheduler)
+            in_flight.append((package["name"], future))
+        
+        # Three stages run side by side: the pool fetches packages, this thread
+        # inflates their members and the writer stage puts them on disk
+        stage = WriterStage(writer, queue_bytes)
+        started = time.perf_counter()
+        fetch_busy = scheduler.busy_time()
+        decompress_busy = 0.0
+        
+        with ThreadPoolExecutor(max_workers=window) as executor, tracer.profile("package_loop", binary_type):
+            try:
+                stage.writestr("AppSettings.xml", APP_SETTINGS_XML)
+                
+                while pending and len(in_flight) < window:
+                    submit_next()
+                
+                for package in packages:
+                    package_name = package["name"]
+                    progress.update(task, description=f"[cyan]{label}{package_name}")
+                    
+                    if package_name in reusable:
+                        with tracer.span("link", package=package_name, files=len(reusable[package_name])):
+                            for path in reusable[package_name]:
+                                stage.link(path, Path(base_dir) / path)
+                        installed_files[package_name] = reusable[package_name]
+                        advance(package["size"])
+                        continue
+                    
+                    _, future = in_flight.popleft()
+                    
+                    with tracer.span("wait", package=package_name):
+                        package_file = future.result()
+                    
+                    with package_file:
+                        if pending:
+                            submit_next()
+                        
+                        extract_root = extract_roots.get(package_name, "")
+                        unpack_started = time.perf_counter()
+                        blocked = stage.queue.blocked
+                        with tracer.span("unpack", package=package_name, bytes=package.get("size", 0)):
+                            installed_files[package_name] = copy_package_members(
+                                package_file, stage, extract_root, advance=advance, window_bytes=unpack_window_bytes
+                            )
+                        decompress_busy += time.perf_counter() - unpack_started - (stage.queue.blocked - blocked)
+                
+                # Saved next to the install so the next version can be applied as a delta
+                stage.writestr("rbxPkgManifest.txt", manifest_text)
+                stage.writestr(INSTALL_RECORD_NAME, json.dumps({
+                    "binary_type": binary_type,
+                    "version_hash": version_hash,
+                    "installed_at": time.time(),
+                    "packages": [
+                        {
+                            "name": package["name"],
+                            "checksum": package["checksum"],
+                            "files": installed_files[package["name"]]
+                        }
+                        for package in packages
+                    ]
+                }, indent=2))
+                stage.finish()
+                # The manifest sizes are only a guide, so make sure the bar ends full
+                progress.update(task, completed=total_bytes)
+            except BaseException as e:
+                stage.abort(e)
+                # Whatever was already downloaded stays in the journal for the next run
+                if journal:
+                    journal.stop()
+                for _, future in in_flight:
+                    if not future.cancel() and future.exception() is None:
+                        future.result().close()
+                if isinstance(e, PipelineAborted) and stage.error:
+                    raise stage.error
+                raise
+            finally:
+                writer.close()
+        
+        utilization = pipeline_utilization(time.perf_counter() - started, {
+            "fetch": scheduler.busy_time() - fetch_busy,
+            "decompress": decompress_busy,
+            "write": stage.busy
+        })
+    
+    if journal and owns_journal:
+        journal.finish()
+    elif journal:
+        journal.release()
+    
+    console.print(f"[green]{label}Done![/green]")
+    
+    if cache and owns_cache:
+        console.print(f"[dim]{cache.summary()}[/dim]")
+    if owns_scheduler:
+        console.print(f"[dim]{scheduler.summary()}[/dim]")
+    console.print(f"[dim]{label}{utilization}[/dim]")
+
+
+def pipeline_utilization(elapsed, busy):
+    elapsed = max(elapsed, 1e-6)
+    with tracer.span("pipeline", seconds=round(elapsed, 3)) as span:
+        for name, seconds in busy.items():
+            span[f"{name}_busy"] = round(min(seconds / elapsed, 1.0), 3)
+    
+    stages = ", ".join(f"{name} {min(seconds / elapsed, 1.0):.0%}" for name, seconds in busy.items())
+    return f"Pipeline: {stages} busy over {elapsed:.1f}s"
+
+
+def extract_zip(zip_path, extract_to, workers=EXTRACT_WORKERS, progress=None, store=None):
+    console.print("\n[cyan]Extracting...[/cyan]")
+    writer = DirectoryPackageWriter(extract_to, store)
+    
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        members = zip_ref.infolist()
+    
+    # Later duplicates overwrite earlier ones, the same as extracting in order
+    files = {}
+    for member in members:
+        target = writer.target(member.filename)
+        if member.filename.endswith("/"):
+            target.mkdir(parents=True, exist_ok=True)
+        else:
+            files[target] = member
+    
+    for directory in {target.parent for target in files}:
+        directory.mkdir(parents=True, exist_ok=True)
+    
+    total_bytes = sum(member.file_size for member in files.values())
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+    
+    def extract_member(target, member):
+        # ZipFile handles aren't safe to share between threads, so each worker opens its own
+        if not hasattr(local, "zip_ref"):
+            local.zip_ref = zipfile.ZipFile(zip_path, "r")
+            with handles_lock:
+                handles.append(local.zip_ref)
+        
+        with local.zip_ref.open(member) as source, writer.open_target(target) as f:
+            preallocate(f.fileno(), member.file_size)
+            for chunk in iter(lambda: source.read(EXTRACT_BUFFER_SIZE), b""):
+                f.write(chunk)
+                progress.advance(task, len(chunk))
+    
+    from rich.progress import SpinnerColumn, BarColumn, TextColumn, DownloadColumn, TransferSpeedColumn
+    
+    started = time.perf_counter()
+    
+    with tracer.span("extract", bytes=total_bytes, files=len(files)), progress_display(
+        progress,
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        DownloadColumn(),
+        TransferSpeedColumn()
+    ) as progress:
+        task = progress.add_task("[cyan]Extracting files...", total=total_bytes)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Largest first so one big executable doesn't end up running alone at the end
+                ordered = sorted(files.items(), key=lambda item: item[1].file_size, reverse=True)
+                for future in [executor.submit(extract_member, target, member) for target, member in ordered]:
+                    future.result()
+        finally:
+            for handle in handles:
+                handle.close()
+    
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    console.print(f"[green]Done! {len(files)} files, {format_size(total_bytes)} "
+                  f"in {elapsed:.1f}s ({format_size(total_bytes / elapsed)}/s)[/green]")
+
+
+def copy_range(source, offset, size, target):
+    # Kernel-side copies where the platform has them, so the data never passes
+    # through Python; a memory map of the source otherwise
+    remaining = size
+    
+    for copier in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+        if copier is None or remaining == 0:
+            continue
+        try:
+            while remaining:
+                if copier is os.sendfile:
+                    copied = os.sendfile(target.fileno(), source.fileno(), offset + size - remaining, remaining)
+                else:
+                    copied = os.copy_file_range(source.fileno(), target.fileno(), remaining,
+                                                offset + size - remaining)
+                if copied == 0:
+                    raise EOFError(f"Bundle ends before offset {offset + size}")
+                remaining -= copied
+        except OSError:
+            # Not supported between these files, carry on with the next method
+            continue
+    
+    if remaining:
+        import mmap
+        
+        start = offset + size - remaining
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            with view[start:start + remaining] as chunk:
+                target.write(chunk)
+
+
+class BundleMember:
+    def __init__(self, writer, path):
+        self.writer = writer
+        self.path = path
+        self.offset = writer.data.tell()
+        self.sha256 = hashlib.sha256()
+    
+    def write(self, data):
+        self.sha256.update(data)
+        return self.writer.data.write(data)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.writer.add(self.path, self.offset, self.writer.data.tell() - self.offset, self.sha256.hexdigest())
+
+
+class BundlePackageWriter:
+    # Members are appended to a data file as they arrive; close() puts the index
+    # in front of it. Used from one thread, like the other writers.
+    def __init__(self, output_path, binary_type, version_hash):
+        self.output_path = Path(output_path)
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self.data = tempfile.TemporaryFile(dir=self.output_path.parent)
+        self.binary_type = binary_type
+        self.version_hash = version_hash
+        self.entries = {}
+    
+    def writestr(self, path, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self.open(path, None) as f:
+            f.write(data)
+    
+    def open(self, path, file_info):
+        return BundleMember(self, path)
+    
+    def link(self, path, source):
+        with open(source, "rb") as src, self.open(path, None) as f:
+            shutil.copyfileobj(src, f, CHUNK_SIZE)
+    
+    def reserve(self, size):
+        preallocate(self.data.fileno(), size)
+    
+    def add(self, path, offset, size, digest):
+        # A later member with the same path replaces the earlier one, as when extracting
+        self.entries[path] = {"path": path, "offset": offset, "size": size, "sha256": digest}
+    
+    def close(self):
+        index = json.dumps({
+            "binary_type": self.binary_type,
+            "version_hash": self.version_hash,
+            "created_at": time.time(),
+            "files": list(self.entries.values())
+        }).encode("utf-8")
+        
+        # Data starts on an aligned offset, so the copies when installing line up with pages
+        header_size = len(BUNDLE_MAGIC) + 8 + len(index)
+        padding = -header_size % BUNDLE_ALIGNMENT
+        data_size = self.data.tell()
+        
+        temp_path = self.output_path.with_name(self.output_path.name + ".tmp")
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(BUNDLE_MAGIC + len(index).to_bytes(8, "little") + index + b"\0" * padding)
+                f.flush()
+                self.data.flush()
+                copy_range(self.data, 0, data_size, f)
+            os.replace(temp_path, self.output_path)
+        finally:
+            self.data.close()
+            if temp_path.exists():
+                os.remove(temp_path)
+
+
+class Bundle:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = open(self.path, "rb")
+        
+        try:
+            if self.file.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                raise ValueError(f"{self.path.name} is not a WEAO bundle")
+            index_size = int.from_bytes(self.file.read(8), "little")
+            self.index = json.loads(self.file.read(index_size))
+        except BaseException:
+            self.file.close()
+            raise
+        
+        header_size = len(BUNDLE_MAGIC) + 8 + index_size
+        self.data_start = header_size + (-header_size % BUNDLE_ALIGNMENT)
+        self.files = self.index["files"]
+        self.binary_type = self.index["binary_type"]
+        self.version_hash = self.index["version_hash"]
+    
+    def copy_to(self, entry, target):
+        copy_range(self.file, self.data_start + entry["offset"], entry["size"], target)
+    
+    def close(self):
+        self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def extract_bundle(bundle, extract_to, workers=EXTRACT_WORKERS, verify=False, store=None, progress=None):
+    writer = DirectoryPackageWriter(extract_to)
+    total_bytes = sum(entry["size"] for entry in bundle.files)
+    
+    def verify_copy(entry, path):
+        # The store trusts its file names, so anything headed there is always checked
+        if (verify or store) and hash_file(path, hashlib.sha256()).hexdigest() != entry["sha256"]:
+            raise CorruptPackageError(f"{entry['path']}: SHA-256 mismatch in bundle")
+    
+    def extract_file(entry):
+        target = writer.target(entry["path"])
+        target.parent.mkdir(parents=True, exist_ok=True)
+        
+        if store and store.link_existing(entry["sha256"], target):
+            pass
+        elif store:
+            with store.create_temp() as f:
+                bundle.copy_to(entry, f)
+            verify_copy(entry, f.name)
+            store.commit(f.name, entry["sha256"], target)
+        else:
+            with open(target, "wb") as f:
+                bundle.copy_to(entry, f)
+            verify_copy(entry, target)
+        
+        progress.advance(task, entry["size"])
+    
+    from rich.progress import SpinnerColumn, BarColumn, TextColumn, DownloadColumn, TransferSpeedColumn
+    
+    started = time.perf_counter()
+    
+    with tracer.span("extract_bundle", bytes=total_bytes, files=len(bundle.files)), progress_display(
+        progress,
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        DownloadColumn(),
+        TransferSpeedColumn()
+    ) as progress:
+        task = progress.add_task("[cyan]Installing from bundle...", total=total_bytes)
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(extract_file, entry) for entry in bundle.files]:
+                future.result()
+    
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    console.print(f"[green]Done! {len(bundle.files)} files, {format_size(total_bytes)} "
+                  f"in {elapsed:.1f}s ({format_size(total_bytes / elapsed)}/s)[/green]")
+
+
+def get_roblox_install_path(binary_type):
+    local_appdata = Path(os.environ.get("LOCALAPPDATA", ""))
+    
+    if binary_type in ["WindowsPlayer", "WindowsStudio64"]:
+        return local_appdata / "Roblox" / "Versions"
+    else:
+        return None
+
+
+def kill_roblox_processes():
+    with tracer.span("kill_processes"):
+        _kill_roblox_processes()
+
+
+def _kill_roblox_processes():
+    print("Closing Roblox...")
+    
+    killed = []
+    for name in ROBLOX_PROCESSES:
+        try:
+            result = subprocess.run(["taskkill", "/F", "/IM", name], capture_output=True, check=False)
+        except OSError:
+            continue
+        if result.returncode == 0:
+            killed.append(name)
+    
+    # taskkill returns before the processes are gone and their files unlocked
+    wait_for_exit(killed)
+
+
+def running_processes(names):
+    result = subprocess.run(["tasklist", "/FO", "CSV", "/NH"], capture_output=True, text=True, check=False)
+    running = {line.split(",")[0].strip('"').lower() for line in result.stdout.splitlines() if line}
+    return [name for name in names if name.lower() in running]
+
+
+def wait_for_exit(names, timeout=PROCESS_EXIT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    
+    while names and time.monotonic() < deadline:
+        try:
+            names = running_processes(names)
+        except OSError:
+            return
+        if names:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+def rename_with_retry(source, target, timeout=RENAME_TIMEOUT):
+    # Antivirus scanners and the search indexer briefly hold handles on new files
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+_active_staging = {}
+_staging_lock = threading.Lock()
+_purge_lock = threading.Lock()
+
+
+def create_staging_dir(install_path, version_hash):
+    install_path.mkdir(parents=True, exist_ok=True)
+    staging_dir = Path(tempfile.mkdtemp(prefix=f"{STAGING_PREFIX}{version_hash}-", dir=install_path))
+    lock = FileLock(staging_dir / STAGING_LOCK_NAME)
+    lock.acquire()
+    with _staging_lock:
+        _active_staging[staging_dir] = lock
+    return staging_dir
+
+
+def release_staging_dir(staging_dir):
+    with _staging_lock:
+        lock = _active_staging.pop(staging_dir, None)
     
-    final_zip.close()
-    console.print("[green]Done![/green]")
+    # Windows can't rename a folder with an open file in it, so the lock goes first
+    if lock:
+        lock.release()
+        try:
+            lock.path.unlink()
+        except OSError:
+            pass
 
 
-def extract_zip(zip_path, extract_to):
-    console.print("\n[cyan]Extracting...[/cyan]")
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        members = zip_ref.namelist()
-        
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-            console=console
-        ) as progress:
-            task = progress.add_task("[cyan]Extracting files...", total=len(members))
-            
-            for member in members:
-                zip_ref.extract(member, extract_to)
-                progress.advance(task)
+def is_stale_staging(folder):
+    with _staging_lock:
+        if folder in _active_staging:
+            return False
     
-    console.print("[green]Done![/green]")
+    # Another process is still building it
+    lock = FileLock(folder / STAGING_LOCK_NAME, create=False)
+    if (folder / STAGING_LOCK_NAME).exists():
+        if not lock.acquire(blocking=False):
+            return False
+        lock.release()
+    
+    # Removing the lock touches the folder, so one that was just committed
+    # elsewhere is still too new to count as left behind
+    try:
+        return time.time() - folder.stat().st_mtime > STAGING_STALE_AGE
+    except OSError:
+        return False
 
 
-def get_roblox_install_path(binary_type):
-    local_appdata = Path(os.environ.get("LOCALAPPDATA", ""))
+def commit_staged(staging_dir, target):
+    # The version only appears under its real name once it's complete
+    with tracer.span("commit", version=target.name):
+        replaced = target.exists()
+        if replaced:
+            kill_roblox_processes()
+            bury(target)
+        release_staging_dir(staging_dir)
+        rename_with_retry(staging_dir, target)
     
-    if binary_type in ["WindowsPlayer", "WindowsStudio64"]:
-        return local_appdata / "Roblox" / "Versions"
-    else:
-        return None
+    if replaced:
+        purge_graveyard(target.parent)
 
 
-def kill_roblox_processes():
-    print("Closing Roblox...")
+def discard_staged(staging_dir):
+    release_staging_dir(staging_dir)
+    
     try:
-        subprocess.run(["taskkill", "/F", "/IM", "RobloxPlayerBeta.exe"], 
-                      capture_output=True, check=False)
-        subprocess.run(["taskkill", "/F", "/IM", "RobloxStudioBeta.exe"], 
-                      capture_output=True, check=False)
-        subprocess.run(["taskkill", "/F", "/IM", "weblauncher.exe"], 
-                      capture_output=True, check=False)
-        time.sleep(2)
-    except:
-        pass
+        bury(staging_dir)
+    except OSError:
+        return
+    purge_graveyard(staging_dir.parent)
+
 
+def bury(folder):
+    graveyard = folder.parent / GRAVEYARD_NAME
+    graveyard.mkdir(exist_ok=True)
+    rename_with_retry(folder, graveyard / f"{folder.name}-{os.urandom(4).hex()}")
 
-def delete_old_roblox(install_path):
+
+def purge_graveyard(install_path):
+    graveyard = install_path / GRAVEYARD_NAME
+    
+    def purge():
+        with _purge_lock, tracer.span("purge_graveyard"):
+            # Anything still locked is left for the next purge
+            if graveyard.exists():
+                for folder in list(graveyard.iterdir()):
+                    shutil.rmtree(folder, ignore_errors=True)
+                try:
+                    graveyard.rmdir()
+                except OSError:
+                    pass
+            
+            # Files in the store go once the last version using them is gone
+            if (install_path / FILE_STORE_NAME).exists():
+                with tracer.span("collect_store"):
+                    get_file_store(install_path).collect()
+    
+    # Not a daemon, so a command line run still finishes the deletion before exiting
+    thread = threading.Thread(target=purge, name="graveyard-purge")
+    thread.start()
+    return thread
+
+
+def delete_old_roblox(install_path, keep=None, binary_type=None):
     if not install_path or not install_path.exists():
         return
     
-    kill_roblox_processes()
+    if isinstance(keep, str):
+        keep = {keep}
+    keep = keep or set()
     
-    print("Deleting old versions...")
-    import shutil
+    old_versions = [folder for folder in install_path.glob("version-*")
+                    if folder.is_dir() and folder.name not in keep]
     
-    max_retries = 3
-    for version_folder in install_path.glob("version-*"):
-        if version_folder.is_dir():
+    # Player and Studio share the Versions folder, so an install only replaces its own type
+    if binary_type:
+        versions = load_install_index(install_path)["versions"]
+        old_versions = [folder for folder in old_versions
+                        if (versions[folder.name]["binary_type"] if folder.name in versions
+                            else detect_binary_type(folder)) == binary_type]
+    # Left behind by an install that crashed or was interrupted
+    stale = [folder for folder in install_path.glob(STAGING_PREFIX + "*") if is_stale_staging(folder)]
+    
+    if old_versions:
+        kill_roblox_processes()
+        print("Deleting old versions...")
+    
+    # Old folders are only renamed out of the way here, the slow delete runs in the background
+    removed = []
+    for version_folder in old_versions + stale:
+        if version_folder in old_versions:
             print(f"  {version_folder.name}")
-            for attempt in range(max_retries):
-                try:
-                    shutil.rmtree(version_folder)
-                    break
-                except PermissionError:
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
-                    else:
-                        print(f"    Warning: Could not delete (files in use)")
+        with tracer.span("delete_old", version=version_folder.name):
+            try:
+                bury(version_folder)
+                removed.append(version_folder.name)
+            except OSError:
+                print(f"    Warning: Could not delete (files in use)")
     
-    print("Done")
+    if old_versions:
+        forget_installs(install_path, removed)
+    purge_graveyard(install_path)
+    
+    if old_versions:
+        print("Done")
 
 
 def register_protocol_handlers():
@@ -351,19 +2831,16 @@ def register_protocol_handlers():
         print("Error: No Roblox installation found")
         return False
     
-    versions = list(roblox_path.glob("version-*"))
-    if not versions:
+    version_path = get_active_version("WindowsPlayer")
+    if not version_path:
         print("Error: No Roblox version found")
         return False
     
-    version_path = max(versions, key=lambda p: p.stat().st_mtime)
-    launcher_path = version_path / "RobloxPlayerBeta.exe"
-    
-    if not launcher_path.exists():
-        print("Error: RobloxPlayerBeta.exe not found")
-        return False
+    launcher_path = version_path / LAUNCHERS["WindowsPlayer"]
     
     try:
+        import winreg
+        
         for protocol in ["roblox", "roblox-player"]:
             key_path = f"Software\\Classes\\{protocol}"
             
@@ -385,6 +2862,8 @@ def unregister_protocol_handlers():
     print("\nRemoving protocol handlers...")
     
     try:
+        import winreg
+        
         for protocol in ["roblox", "roblox-player"]:
             try:
                 winreg.DeleteKey(winreg.HKEY_CURRENT_USER, f"Software\\Classes\\{protocol}\\shell\\open\\command")
@@ -407,23 +2886,14 @@ def launch_roblox():
     roblox_path = get_roblox_install_path("WindowsPlayer")
     if not roblox_path or not roblox_path.exists():
         console.print("[red]Error: No Roblox Player installation found[/red]")
-        input("\nPress Enter to continue...")
         return False
     
-    versions = list(roblox_path.glob("version-*"))
-    if not versions:
+    version_path = get_active_version("WindowsPlayer")
+    if not version_path:
         console.print("[red]Error: No Roblox Player version found[/red]")
-        input("\nPress Enter to continue...")
         return False
     
-    version_path = max(versions, key=lambda p: p.stat().st_mtime)
-    launcher_path = version_path / "RobloxPlayerBeta.exe"
-    
-    if not launcher_path.exists():
-        console.print("[red]Error: RobloxPlayerBeta.exe not found[/red]")
-        console.print(f"[yellow]Looked in: {version_path}[/yellow]")
-        input("\nPress Enter to continue...")
-        return False
+    launcher_path = version_path / LAUNCHERS["WindowsPlayer"]
     
     try:
         subprocess.Popen([str(launcher_path)], creationflags=subprocess.CREATE_NEW_CONSOLE)
@@ -432,11 +2902,10 @@ def launch_roblox():
         return True
     except Exception as e:
         console.print(f"[red]Error launching: {e}[/red]")
-        input("\nPress Enter to continue...")
         return False
 
 
-def clean_all_roblox_versions():
+def clean_all_roblox_versions(confirm=None):
     print("\n" + "=" * 40)
     print("DELETE VERSIONS")
     print("=" * 40)
@@ -458,20 +2927,722 @@ def clean_all_roblox_versions():
     for folder in version_folders:
         print(f"  {folder.name}")
 
-    confirm = input("\nDelete all? (y/n): ").strip().lower()
+    if confirm is None:
+        confirm = input("\nDelete all? (y/n): ").strip().lower() == "y"
 
-    if confirm == "y":
-        import shutil
-
-        for folder in version_folders:
-            print(f"Deleting {folder.name}")
-            shutil.rmtree(folder, ignore_errors=True)
-        print("\nDone")
+    if confirm:
+        delete_old_roblox(versions_path)
     else:
         print("\nCancelled")
 
 
+def resolve_version(binary_type, version):
+    if version in ("latest", "downgrade"):
+        mode = "1" if version == "latest" else "2"
+        return get_version_from_history(mode, binary_type)
+    
+    return version
+
+
+def install_roblox(binary_type, version_hash, export_zip=False, cleanup=True, **options):
+    with tracer.span("install", binary_type=binary_type, version=version_hash):
+        _install_roblox(binary_type, version_hash, export_zip, cleanup, **options)
+
+
+def _install_roblox(binary_type, version_hash, export_zip=False, cleanup=True, progress=None, label="",
+                    file_store=FILE_STORE, **options):
+    downloads_dir = Path("downloads")
+    roblox_install_path = get_roblox_install_path(binary_type)
+    options.update(progress=progress, label=label)
+    
+    if export_zip:
+        downloads_dir.mkdir(exist_ok=True)
+        zip_filename = f"WEAO-{binary_type}-{version_hash}.zip"
+        zip_path = downloads_dir / zip_filename
+        
+        download_and_package_roblox(binary_type, version_hash, zip_path, **options)
+    
+    if roblox_install_path:
+        extract_dir = roblox_install_path / version_hash
+        
+        # The new version is built under a temporary name next to the real folder
+        # and renamed into place at the end. Roblox keeps running until then, and
+        # a failed install never leaves a half-written version behind.
+        base_dir = None
+        if DELTA_INSTALL and not export_zip and roblox_install_path.exists():
+            base_dir = find_delta_base(roblox_install_path, binary_type, version_hash)
+        
+        staging_dir = create_staging_dir(roblox_install_path, version_hash)
+        store = get_file_store(roblox_install_path) if file_store else None
+        try:
+            if export_zip:
+                extract_zip(zip_path, staging_dir, progress=progress, store=store)
+            else:
+                download_and_install_roblox(binary_type, version_hash, staging_dir, store,
+                                            base_dir=base_dir, **options)
+            commit_staged(staging_dir, extract_dir)
+        except BaseException:
+            discard_staged(staging_dir)
+            raise
+        
+        record_install(roblox_install_path, binary_type, version_hash)
+        
+        if store:
+            console.print(f"[dim]{store.summary()}[/dim]")
+        
+        if cleanup:
+            delete_old_roblox(roblox_install_path, keep=version_hash, binary_type=binary_type)
+        
+        console.print(f"\n[green]{label}Installed to: {extract_dir.absolute()}[/green]")
+        
+        if binary_type == "WindowsPlayer":
+            register_protocol_handlers()
+    
+    if export_zip:
+        console.print(f"[green]Zip saved to: {zip_path.absolute()}[/green]\n")
+
+
+class InsufficientSpaceError(OSError):
+    pass
+
+
+def disk_free(path):
+    # The folder may not exist yet, in which case its nearest existing parent is on the same drive
+    path = Path(path).absolute()
+    while not path.exists() and path.parent != path:
+        path = path.parent
+    return os.stat(path).st_dev, shutil.disk_usage(path).free
+
+
+def preflight(targets, export_zip=False, file_store=FILE_STORE):
+    # Adds up what every install will write, per drive, from the sizes in the
+    # manifests and fails before anything is downloaded if it won't fit
+    package_cache = PackageCache() if PACKAGE_CACHE_MAX_BYTES > 0 else None
+    drives = {}
+    
+    def need(path, size):
+        device, free = disk_free(path)
+        drive = drives.setdefault(device, {"free": free, "needed": 0, "paths": set()})
+        drive["needed"] += size
+        drive["paths"].add(str(path))
+    
+    with tracer.span("preflight", installs=len(targets)) as span:
+        for binary_type, version_hash in targets:
+            packages = parse_package_manifest(fetch_manifest(version_hash))
+            unpacked = sum(package["size"] for package in packages)
+            install_path = get_roblox_install_path(binary_type)
+            
+            # Unchanged packages are hardlinked from the installed version and take no space
+            reused = 0
+            if install_path and DELTA_INSTALL and not export_zip and not file_store and install_path.exists():
+                base_dir = find_delta_base(install_path, binary_type, version_hash)
+                reusable = reusable_packages(packages, base_dir)
+                reused = sum(package["size"] for package in packages if package["name"] in reusable)
+            
+            if package_cache or RESUME_DOWNLOADS:
+                need(Path("downloads"), sum(
+                    package["packed_size"] for package in packages
+                    if not (package_cache and package["checksum"] and package_cache.path(package["checksum"]).exists())
+                ))
+            if export_zip:
+                need(Path("downloads"), unpacked)
+            if install_path:
+                need(install_path, unpacked - reused)
+        
+        span["bytes"] = sum(drive["needed"] for drive in drives.values())
+    
+    for drive in drives.values():
+        paths = ", ".join(sorted(drive["paths"]))
+        if drive["needed"] + PREFLIGHT_HEADROOM > drive["free"]:
+            raise InsufficientSpaceError(
+                errno.ENOSPC,
+                f"Not enough disk space for {paths}: {format_size(drive['needed'])} needed, "
+                f"{format_size(drive['free'])} free"
+            )
+        console.print(f"[dim]Preflight: {format_size(drive['needed'])} needed for {paths}, "
+                      f"{format_size(drive['free'])} free[/dim]")
+
+
+def install_roblox_many(targets, export_zip=False, cleanup=True, **options):
+    preflight(targets, export_zip, options.get("file_store", FILE_STORE))
+    
+    if len(targets) == 1:
+        binary_type, version_hash = targets[0]
+        install_roblox(binary_type, version_hash, export_zip, cleanup, **options)
+        return
+    
+    # Plan the installs together: packages with the same checksum in several
+    # manifests are downloaded once and the installs run side by side
+    checksums = {}
+    for binary_type, version_hash in targets:
+        for package in parse_package_manifest(fetch_manifest(version_hash)):
+            if package["checksum"]:
+                checksums.setdefault(package["checksum"], set()).add(binary_type)
+    shared_count = sum(1 for types in checksums.values() if len(types) > 1)
+    console.print(f"[green]{shared_count} package(s) are shared and will only be downloaded once[/green]")
+    
+    # Sharing goes through the package cache, so use a throwaway one if it's turned off
+    temp_cache_dir = None
+    if options.get("cache") is None:
+        if PACKAGE_CACHE_MAX_BYTES > 0:
+            options["cache"] = PackageCache()
+        else:
+            temp_cache_dir = tempfile.mkdtemp(prefix="weao-cache-")
+            options["cache"] = PackageCache(temp_cache_dir, max_bytes=float("inf"))
+    if options.get("journal") is None and RESUME_DOWNLOADS:
+        options["journal"] = DownloadJournal()
+    options["shared"] = SingleFlight()
+    # One scheduler for all installs, since they share the same link
+    options["scheduler"] = DownloadScheduler(options.pop("workers", DOWNLOAD_WORKERS),
+                                             adaptive=options.pop("adaptive", ADAPTIVE_CONCURRENCY))
+    
+    from rich.progress import (Progress, SpinnerColumn, BarColumn, TextColumn, DownloadColumn,
+                               TransferSpeedColumn, TimeRemainingColumn)
+    
+    errors = []
+    succeeded = []
+    try:
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+            console=console.get()
+        ) as progress:
+            with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+                futures = [
+                    executor.submit(install_roblox, binary_type, version_hash, export_zip, False,
+                                    progress=progress, label=f"{BINARY_LABELS[binary_type]}: ", **options)
+                    for binary_type, version_hash in targets
+                ]
+                try:
+                    for target, future in zip(targets, futures):
+                        try:
+                            future.result()
+                            succeeded.append(target)
+                        except Exception as e:
+                            errors.append(e)
+                except BaseException:
+                    # Ctrl-C lands here, the installs still running have to be told to stop
+                    if options.get("journal"):
+                        options["journal"].stop()
+                    for future in futures:
+                        future.cancel()
+                    raise
+    finally:
+        if temp_cache_dir:
+            shutil.rmtree(temp_cache_dir, ignore_errors=True)
+    
+    console.print(f"[dim]{options['cache'].summary()}[/dim]")
+    console.print(f"[dim]{options['scheduler'].summary()}[/dim]")
+    
+    # Only the parts of installs that succeeded are forgotten, a failed one
+    # keeps what it downloaded for the next run
+    if options.get("journal"):
+        options["journal"].finish()
+    
+    # Old versions only go once every install has finished, otherwise one
+    # install would delete the other's new folder
+    if cleanup:
+        installed = {version_hash for _, version_hash in targets}
+        for binary_type, _ in succeeded:
+            delete_old_roblox(get_roblox_install_path(binary_type), keep=installed, binary_type=binary_type)
+    
+    if errors:
+        raise errors[0]
+
+
+def export_bundle(binary_type, version_hash, output_path, **options):
+    install_path = get_roblox_install_path(binary_type)
+    version_dir = install_path / version_hash if install_path else None
+    writer = BundlePackageWriter(output_path, binary_type, version_hash)
+    
+    try:
+        with tracer.span("export_bundle", version=version_hash):
+            if version_dir and (version_dir / "rbxPkgManifest.txt").exists():
+                # Installed already, so the files are taken straight from the version folder
+                console.print(f"\n[cyan]Bundling {version_dir}...[/cyan]")
+                try:
+                    for path in sorted(version_dir.rglob("*")):
+                        if path.is_file():
+                            writer.link(path.relative_to(version_dir).as_posix(), path)
+                finally:
+                    writer.close()
+            else:
+                # Otherwise it's built from the package cache, downloading whatever is missing
+                download_roblox_packages(binary_type, version_hash, writer, **options)
+    except BaseException:
+        if Path(output_path).exists():
+            os.remove(output_path)
+        raise
+    
+    console.print(f"[green]Bundle saved to: {Path(output_path).absolute()} "
+                  f"({format_size(Path(output_path).stat().st_size)})[/green]")
+
+
+def install_bundle(bundle_path, cleanup=True, verify=False, file_store=FILE_STORE):
+    with Bundle(bundle_path) as bundle:
+        binary_type, version_hash = bundle.binary_type, bundle.version_hash
+        roblox_install_path = get_roblox_install_path(binary_type)
+        extract_dir = roblox_install_path / version_hash
+        console.print(f"\n[cyan]Installing {BINARY_LABELS[binary_type]} {version_hash} from {Path(bundle_path).name}[/cyan]")
+        
+        store = get_file_store(roblox_install_path) if file_store else None
+        staging_dir = create_staging_dir(roblox_install_path, version_hash)
+        try:
+            with tracer.span("install_bundle", version=version_hash):
+                extract_bundle(bundle, staging_dir, verify=verify, store=store)
+            commit_staged(staging_dir, extract_dir)
+        except BaseException:
+            discard_staged(staging_dir)
+            raise
+    
+    record_install(roblox_install_path, binary_type, version_hash)
+    if store:
+        console.print(f"[dim]{store.summary()}[/dim]")
+    if cleanup:
+        delete_old_roblox(roblox_install_path, keep=version_hash, binary_type=binary_type)
+    
+    console.print(f"\n[green]Installed to: {extract_dir.absolute()}[/green]")
+    
+    if binary_type == "WindowsPlayer":
+        register_protocol_handlers()
+
+
+def use_cache_server(url):
+    # Everything goes through the cache server, which does its own mirror selection
+    global CDN_BASE, CDN_MIRRORS, DEPLOY_HISTORY_URL
+    CDN_BASE = url.rstrip("/")
+    CDN_MIRRORS = []
+    DEPLOY_HISTORY_URL = f"{CDN_BASE}/DeployHistory.txt"
+
+
+class ProxyError(Exception):
+    def __init__(self, status, message=""):
+        super().__init__(message or f"HTTP {status}")
+        self.status = status
+
+
+class CacheProxy:
+    # Answers the CDN's URL layout from disk, filling from upstream on first use.
+    # Packages land in the package cache, verified against the manifest.
+    def __init__(self, root=PROXY_CACHE_DIR, cache=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cache = cache or PackageCache(max_bytes=PACKAGE_CACHE_MAX_BYTES or float("inf"))
+        self.shared = SingleFlight()
+        self.scheduler = DownloadScheduler()
+        self.history_lock = threading.Lock()
+    
+    def resolve(self, path):
+        if path == "/DeployHistory.txt":
+            with self.history_lock:
+                fetch_deploy_history(DEPLOY_HISTORY_MAX_AGE)
+            return DEPLOY_HISTORY_CACHE
+        
+        match = PROXY_PATH_PATTERN.match(path)
+        if not match:
+            raise ProxyError(404)
+        version_hash, name = match.group("version"), match.group("name")
+        
+        manifest_path = self.manifest_path(version_hash)
+        if name == "rbxPkgManifest.txt":
+            return manifest_path
+        
+        packages = parse_package_manifest(manifest_path.read_bytes().decode("utf-8"))
+        package = next((package for package in packages if package["name"] == name), None)
+        if package and package["checksum"]:
+            # Concurrent requests for one package share a single upstream download
+            with fetch_package(get_package_urls(version_hash, name), package, cache=self.cache,
+                               shared=self.shared, scheduler=self.scheduler) as f:
+                return Path(f.name)
+        
+        return self.fill(path.lstrip("/"))
+    
+    def manifest_path(self, version_hash):
+        # fetch_manifest keeps its own copy on disk, which is served as is
+        try:
+            self.shared.do(version_hash, fetch_manifest, version_hash)
+        except ValueError as e:
+            raise ProxyError(403 if str(e) == "Version not available" else 502, str(e))
+        return manifest_cache_path(version_hash)
+    
+    def fill(self, name):
+        path = self.root / name
+        if not path.exists():
+            self.shared.do(name, self.download, name, path)
+        return path
+    
+    def download(self, name, path):
+        import requests
+        
+        url = f"{CDN_BASE}/{name}"
+        try:
+            response = get_session(url).get(url, timeout=DOWNLOAD_TIMEOUT)
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            raise ProxyError(e.response.status_code)
+        except requests.RequestException as e:
+            raise ProxyError(502, str(e))
+        self.write(path, response.content)
+    
+    def write(self, path, data):
+        temp_path = path.with_name(f"{path.name}.{os.urandom(4).hex()}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+
+
+def serve_cache(host="0.0.0.0", port=8000, root=PROXY_CACHE_DIR):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from email.utils import formatdate
+    import requests
+    
+    proxy = CacheProxy(root)
+    
+    class CacheRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_GET(self):
+            self.respond(send_body=True)
+        
+        def do_HEAD(self):
+            self.respond(send_body=False)
+        
+        def respond(self, send_body):
+            try:
+                local_path = proxy.resolve(urlsplit(self.path).path)
+            except ProxyError as e:
+                self.send_error(e.status, str(e))
+                return
+            except (CorruptPackageError, requests.RequestException) as e:
+                self.send_error(502, str(e))
+                return
+            
+            self.send_file(local_path, send_body)
+        
+        def send_file(self, local_path, send_body):
+            stat = local_path.stat()
+            size = stat.st_size
+            etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+            
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            
+            # Ranges are what the journal and the DeployHistory tail fetch rely on
+            start, end, status = 0, size - 1, 200
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            match = re.fullmatch(r"bytes=(\d*)-(\d*)", (range_header or "").strip())
+            if match and (match.group(1) or match.group(2)) and if_range in (None, etag):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                else:
+                    start = max(0, size - int(match.group(2)))
+                
+                if start >= size or start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+            
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain" if local_path.suffix == ".txt" else "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            
+            if send_body and end >= start:
+                with open(local_path, "rb") as f:
+                    self.connection.sendfile(f, start, end - start + 1)
+        
+        def log_message(self, format, *args):
+            console.print(f"[dim]{self.address_string()} {format % args}[/dim]")
+    
+    server = ThreadingHTTPServer((host, port), CacheRequestHandler)
+    server.daemon_threads = True
+    url = f"http://{host if host != '0.0.0.0' else 'localhost'}:{server.server_port}"
+    console.print(f"[green]Serving the Roblox CDN from {proxy.root.absolute()} on {url}[/green]")
+    console.print(f"[dim]Point other machines at it with --cache-server {url} or WEAO_CACHE_SERVER[/dim]")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        console.print(f"[dim]{proxy.cache.summary()}[/dim]")
+
+
+def prefetch_version(version_hash, cache, journal=None, scheduler=None):
+    packages = parse_package_manifest(fetch_manifest(version_hash))
+    missing = [package for package in packages
+               if package["checksum"] and not cache.path(package["checksum"]).exists()]
+    
+    # fetch_package verifies every package against its MD5 before it enters the cache
+    with tracer.span("prefetch", version=version_hash, packages=len(missing)):
+        with ThreadPoolExecutor(max_workers=scheduler.max_workers if scheduler else WATCH_WORKERS) as executor:
+            futures = [
+                executor.submit(fetch_package, get_package_urls(version_hash, package["name"]), package,
+                                cache=cache, journal=journal, scheduler=scheduler)
+                for package in missing
+            ]
+            for future in futures:
+                future.result().close()
+    
+    return sum(package["packed_size"] for package in missing)
+
+
+def watch_deploy_history(binary_types, interval=WATCH_INTERVAL, workers=WATCH_WORKERS, once=False):
+    if PACKAGE_CACHE_MAX_BYTES <= 0:
+        raise ValueError("Prefetching needs the package cache (PACKAGE_CACHE_MAX_BYTES)")
+    
+    # Deliberately slow and steady, so it doesn't compete with whatever else uses the link
+    cache = PackageCache()
+    journal = DownloadJournal() if RESUME_DOWNLOADS else None
+    scheduler = DownloadScheduler(workers, adaptive=False)
+    prefetched = set()
+    
+    console.print(f"[cyan]Watching for new {', '.join(BINARY_LABELS[t] for t in binary_types)} versions "
+                  f"every {interval}s[/cyan]")
+    
+    while True:
+        try:
+            # Only the new tail of DeployHistory.txt is downloaded
+            fetch_deploy_history(max_age=0)
+            
+            for binary_type in binary_types:
+                latest = parse_deploy_history(binary_type, max_versions=1)
+                if not latest or latest[0]["hash"] in prefetched:
+                    continue
+                
+                version_hash = latest[0]["hash"]
+                console.print(f"[cyan]{BINARY_LABELS[binary_type]} {version_hash}: prefetching...[/cyan]")
+                downloaded = prefetch_version(version_hash, cache, journal, scheduler)
+                prefetched.add(version_hash)
+                console.print(f"[green]{BINARY_LABELS[binary_type]} {version_hash} is ready "
+                              f"({format_size(downloaded)} downloaded)[/green]")
+            
+            if journal:
+                journal.finish()
+        except Exception as e:
+            # A flaky connection shouldn't end the watch, the next poll tries again
+            console.print(f"[red]Error: {e}[/red]")
+        
+        if once:
+            return
+        time.sleep(interval)
+
+
+BINARY_LABELS = {
+    "WindowsPlayer": "Player",
+    "WindowsStudio64": "Studio"
+}
+
+BINARY_TYPES = {
+    "player": ["WindowsPlayer"],
+    "studio": ["WindowsStudio64"],
+    "both": ["WindowsPlayer", "WindowsStudio64"]
+}
+
+
+def run_cli(argv):
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog="Downloader.py", description="Roblox Downgrader")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    install_parser = commands.add_parser("install", help="download and install a version")
+    install_parser.add_argument("--type", choices=list(BINARY_TYPES), default="player")
+    install_parser.add_argument("--version", default="latest", help="latest, downgrade or a version hash")
+    install_parser.add_argument("--export-zip", action="store_true", help="also keep a bundled zip in downloads/")
+    install_parser.add_argument("--keep-old", action="store_true",
+                                help="keep the other installed versions so you can switch back to them")
+    install_parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS,
+                                help="parallel downloads to start with")
+    install_parser.add_argument("--fixed-workers", action="store_true",
+                                help="keep --workers downloads instead of adapting to the connection")
+    install_parser.add_argument("--file-store", action="store_true", default=FILE_STORE,
+                                help="hardlink identical files between versions instead of copying them")
+    install_parser.add_argument("--mirror", action="append", metavar="URL",
+                                help="CDN base URL to download from, repeat for more (first is preferred)")
+    install_parser.add_argument("--cache-server", metavar="URL", default=CACHE_SERVER,
+                                help="fetch everything through a serve-cache instance")
+    install_parser.add_argument("--trace", metavar="PATH", help="write a JSON trace of every stage and package")
+    install_parser.add_argument("--profile", choices=["cprofile", "tracemalloc"],
+                                help="profile the package loop (needs --trace)")
+    
+    commands.add_parser("launch", help="launch the active Roblox Player version")
+    
+    export_parser = commands.add_parser("export", help="write a version to a single bundle file for offline installs")
+    export_parser.add_argument("--type", choices=["player", "studio"], default="player")
+    export_parser.add_argument("--version", default="latest", help="latest, downgrade or a version hash")
+    export_parser.add_argument("--output", help="bundle path (default: downloads/WEAO-<type>-<hash>.weaob)")
+    export_parser.add_argument("--cache-server", metavar="URL", default=CACHE_SERVER,
+                               help="fetch everything through a serve-cache instance")
+    
+    import_parser = commands.add_parser("import", help="install a version from a bundle file")
+    import_parser.add_argument("bundle")
+    import_parser.add_argument("--verify", action="store_true", help="check every file's SHA-256")
+    import_parser.add_argument("--keep-old", action="store_true",
+                               help="keep the other installed versions so you can switch back to them")
+    import_parser.add_argument("--file-store", action="store_true", default=FILE_STORE,
+                               help="hardlink identical files between versions instead of copying them")
+    
+    serve_parser = commands.add_parser("serve-cache", help="serve a caching copy of the Roblox CDN to other machines")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--mirror", action="append", metavar="URL",
+                              help="upstream CDN base URL, repeat for more (first is preferred)")
+    
+    watch_parser = commands.add_parser("watch", help="prefetch new versions into the package cache as they deploy")
+    watch_parser.add_argument("--type", choices=list(BINARY_TYPES), default="both")
+    watch_parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="seconds between checks")
+    watch_parser.add_argument("--workers", type=int, default=WATCH_WORKERS, help="parallel downloads")
+    watch_parser.add_argument("--once", action="store_true", help="check once and exit")
+    
+    list_parser = commands.add_parser("list", help="show installed versions")
+    list_parser.add_argument("--type", choices=["player", "studio"], default="player")
+    
+    switch_parser = commands.add_parser("switch", help="make an installed version the active one")
+    switch_parser.add_argument("--type", choices=["player", "studio"], default="player")
+    switch_parser.add_argument("version", help="hash of an installed version")
+    
+    clean_parser = commands.add_parser("clean", help="delete all installed versions")
+    clean_parser.add_argument("--yes", action="store_true", help="don't ask for confirmation")
+    
+    args = parser.parse_args(argv)
+    
+    # A version hash belongs to one binary type, Player and Studio never share one
+    if args.command == "install" and len(BINARY_TYPES[args.type]) > 1 and args.version not in ("latest", "downgrade"):
+        parser.error("a version hash needs --type player or --type studio")
+    
+    if getattr(args, "mirror", None):
+        global CDN_BASE, CDN_MIRRORS
+        CDN_BASE = args.mirror[0].rstrip("/")
+        CDN_MIRRORS = [mirror.rstrip("/") for mirror in args.mirror[1:]]
+    
+    # The cache server itself always talks to the real CDN, even with WEAO_CACHE_SERVER set fleet-wide
+    cache_server = getattr(args, "cache_server", CACHE_SERVER)
+    if cache_server and args.command != "serve-cache":
+        use_cache_server(cache_server)
+    
+    if args.command == "serve-cache":
+        serve_cache(args.host, args.port)
+        return 0
+    
+    if args.command == "watch":
+        try:
+            watch_deploy_history(BINARY_TYPES[args.type], args.interval, args.workers, args.once)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    
+    if args.command == "launch":
+        return 0 if launch_roblox() else 1
+    
+    if args.command in ("export", "import"):
+        try:
+            if args.command == "export":
+                binary_type = BINARY_TYPES[args.type][0]
+                version_hash = resolve_version(binary_type, args.version)
+                output = args.output or Path("downloads") / f"WEAO-{binary_type}-{version_hash}.weaob"
+                export_bundle(binary_type, version_hash, output)
+            else:
+                install_bundle(args.bundle, cleanup=not args.keep_old, verify=args.verify,
+                               file_store=args.file_store)
+        except Exception as e:
+            console.print(f"[red]Error: {e}[/red]")
+            return 1
+        return 0
+    
+    if args.command == "list":
+        binary_type = BINARY_TYPES[args.type][0]
+        active = get_active_version(binary_type)
+        for version_hash, entry in installed_versions(binary_type):
+            marker = "*" if active and active.name == version_hash else " "
+            installed_at = datetime.fromtimestamp(entry["installed_at"]).strftime("%Y-%m-%d %H:%M")
+            print(f"{marker} {version_hash}  {installed_at}  {format_size(entry['size'])}")
+        return 0
+    
+    if args.command == "switch":
+        return 0 if switch_version(BINARY_TYPES[args.type][0], args.version) else 1
+    
+    if args.command == "clean":
+        clean_all_roblox_versions(confirm=True if args.yes else None)
+        return 0
+    
+    if args.trace:
+        tracer.enable(args.profile, str(Path(args.trace).with_suffix(".prof")))
+    
+    failed = False
+    try:
+        targets = [(binary_type, resolve_version(binary_type, args.version)) for binary_type in BINARY_TYPES[args.type]]
+        install_roblox_many(targets, args.export_zip, cleanup=not args.keep_old, workers=args.workers,
+                            adaptive=not args.fixed_workers, file_store=args.file_store)
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/red]")
+        failed = True
+    
+    if args.trace:
+        tracer.write(args.trace)
+        tracer.print_summary()
+        console.print(f"[dim]Trace saved to {args.trace}[/dim]")
+    
+    return 1 if failed else 0
+
+
+def show_installed_versions_and_switch():
+    import questionary
+    
+    choices = []
+    for binary_type in BINARY_LABELS:
+        active = get_active_version(binary_type)
+        for version_hash, entry in installed_versions(binary_type):
+            installed_at = datetime.fromtimestamp(entry["installed_at"]).strftime("%Y-%m-%d %H:%M")
+            marker = " (active)" if active and active.name == version_hash else ""
+            choices.append({
+                "name": f"{BINARY_LABELS[binary_type]:<7} {version_hash}  {installed_at}{marker}",
+                "value": (binary_type, version_hash)
+            })
+    
+    if not choices:
+        console.print("[yellow]No installed versions found[/yellow]")
+        return False
+    
+    choices.append({"name": "Cancel", "value": "cancel"})
+    selection = questionary.select(
+        "Select version to make active",
+        choices=choices,
+        style=get_custom_style(),
+        use_shortcuts=False,
+        use_arrow_keys=True,
+        qmark=">"
+    ).ask()
+    
+    if not selection or selection == "cancel":
+        return False
+    
+    return switch_version(*selection)
+
+
 def main():
+    import questionary
+    from rich.panel import Panel
+    
     while True:
         console.clear()
         console.print(Panel.fit(
@@ -484,19 +3655,20 @@ def main():
             choices=[
                 {"name": "Install Roblox", "value": "install"},
                 {"name": "Launch Roblox", "value": "launch"},
+                {"name": "Switch Active Version", "value": "switch"},
                 {"name": "Register Protocol Handlers", "value": "register"},
                 {"name": "Remove Protocol Handlers", "value": "unregister"},
                 {"name": "Delete All Versions", "value": "delete"},
                 {"name": "Exit", "value": "exit"}
             ],
-            style=custom_style,
+            style=get_custom_style(),
             use_shortcuts=False,
             use_arrow_keys=True,
             qmark=">"
         ).ask()
 
         if action == "delete":
-            if questionary.confirm("Delete all Roblox versions?", default=False, style=custom_style).ask():
+            if questionary.confirm("Delete all Roblox versions?", default=False, style=get_custom_style()).ask():
                 clean_all_roblox_versions()
             input("\nPress Enter to continue...")
             continue
@@ -512,6 +3684,10 @@ def main():
             launch_roblox()
             input("\nPress Enter to continue...")
             continue
+        elif action == "switch":
+            show_installed_versions_and_switch()
+            input("\nPress Enter to continue...")
+            continue
         elif action == "exit":
             console.print("\n[cyan]Goodbye![/cyan]")
             return
@@ -527,40 +3703,38 @@ def main():
             {"name": "Studio", "value": "studio"},
             {"name": "Both (Player + Studio)", "value": "both"}
         ],
-        style=custom_style,
+        style=get_custom_style(),
         use_shortcuts=False,
         use_arrow_keys=True,
         qmark=">"
     ).ask()
     
-    if binary_choice == "both":
-        binary_types = ["WindowsPlayer", "WindowsStudio64"]
-    elif binary_choice == "player":
-        binary_types = ["WindowsPlayer"]
-    else:
-        binary_types = ["WindowsStudio64"]
+    binary_types = BINARY_TYPES.get(binary_choice, BINARY_TYPES["studio"])
 
     version_choice = questionary.select(
         "Select version",
         choices=[
             {"name": "Latest", "value": "latest"},
             {"name": "Downgrade (3 versions back)", "value": "downgrade"},
-            {"name": "Browse Last 15 Versions", "value": "list"},
+            {"name": "Browse Version History", "value": "list"},
             {"name": "Custom Hash", "value": "custom"}
         ],
-        style=custom_style,
+        style=get_custom_style(),
         use_shortcuts=False,
         use_arrow_keys=True,
         qmark=">"
     ).ask()
 
-    downloads_dir = Path("downloads")
-    downloads_dir.mkdir(exist_ok=True)
+    export_zip = questionary.confirm(
+        "Also save a bundled zip to downloads/?",
+        default=False,
+        style=get_custom_style()
+    ).ask()
 
+    targets = []
     for binary_type in binary_types:
         if len(binary_types) > 1:
-            type_name = "Player" if binary_type == "WindowsPlayer" else "Studio"
-            console.print(f"\n[bold cyan]Installing {type_name}...[/bold cyan]")
+            console.print(f"\n[bold cyan]{BINARY_LABELS[binary_type]}[/bold cyan]")
         
         if version_choice == "list":
             version_hash = show_version_list_and_select(binary_type)
@@ -570,15 +3744,14 @@ def main():
         elif version_choice == "custom":
             version_hash = questionary.text(
                 f"Enter version hash for {binary_type}:",
-                style=custom_style
+                style=get_custom_style()
             ).ask()
             if not version_hash:
                 console.print("[red]Empty hash[/red]")
                 continue
         else:
             try:
-                mode = "1" if version_choice == "latest" else "2"
-                version_hash = get_version_from_history(mode, binary_type)
+                version_hash = resolve_version(binary_type, version_choice)
                 if not version_hash:
                     console.print("[red]Failed[/red]")
                     continue
@@ -586,38 +3759,27 @@ def main():
                 console.print(f"[red]Error: {e}[/red]")
                 continue
 
-        try:
-            zip_filename = f"WEAO-{binary_type}-{version_hash}.zip"
-            zip_path = downloads_dir / zip_filename
-            
-            download_and_package_roblox(binary_type, version_hash, zip_path)
+        targets.append((binary_type, version_hash))
 
-            roblox_install_path = get_roblox_install_path(binary_type)
-            
-            if roblox_install_path:
-                delete_old_roblox(roblox_install_path)
-                
-                roblox_install_path.mkdir(parents=True, exist_ok=True)
-                extract_dir = roblox_install_path / version_hash
-                extract_dir.mkdir(exist_ok=True)
-                
-                kill_roblox_processes()
-                extract_zip(zip_path, extract_dir)
-                
-                console.print(f"\n[green]Installed to: {extract_dir.absolute()}[/green]")
-                
-                if binary_type == "WindowsPlayer":
-                    register_protocol_handlers()
-                
-                os.remove(zip_path)
-                console.print("[green]Zip deleted[/green]\n")
+    if not targets:
+        return
 
-        except Exception as e:
-            console.print(f"\n[red]Error: {e}[/red]")
-            time.sleep(2)
+    try:
+        install_roblox_many(targets, export_zip)
+    except Exception as e:
+        console.print(f"\n[red]Error: {e}[/red]")
+        time.sleep(2)
 
 
 if __name__ == "__main__":
+    check_and_install_dependencies()
+    
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    
+    if CACHE_SERVER:
+        use_cache_server(CACHE_SERVER)
+    
     while True:
         try:
             main()
@@ -0,0 +1,385 @@
+import sys
+import os
+import io
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import zipfile
+import multiprocessing
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import Downloader
+
+VERSION_HASH = "version-0123456789abcdef"
+STAGES = ["history", "package", "extract", "install"]
+
+
+def parse_size(value):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def peak_rss():
+    # ru_maxrss on Linux still counts the parent's memory from before the spawn,
+    # which here includes every file the fake CDN serves. VmHWM starts over at exec.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t)
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+    return counters.PeakWorkingSetSize
+
+
+def make_package(rng, files, size, prefix):
+    buffer = io.BytesIO()
+    per_file = max(1, size // files)
+
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as package_zip:
+        for index in range(files):
+            # Half random, half repeated so deflate has something realistic to do
+            random_part = rng.getrandbits(8 * (per_file // 2)).to_bytes(per_file // 2, "little")
+            data = random_part + random_part[:64] * ((per_file - len(random_part)) // 64)
+            package_zip.writestr(f"{prefix}\\dir{index % 8}\\file{index}.bin", data)
+
+    return buffer.getvalue()
+
+
+def build_cdn_files(packages=20, package_size=4 * 1024 * 1024, files_per_package=50,
+                    history_lines=20000, version_hash=VERSION_HASH, seed=0):
+    rng = random.Random(seed)
+    files = {}
+
+    names = list(Downloader.EXTRACT_ROOTS_PLAYER)
+    names += [f"extra-{index}.zip" for index in range(max(0, packages - len(names)))]
+
+    manifest = ["v0"]
+    for name in names[:packages]:
+        data = make_package(rng, files_per_package, package_size, name[:-len(".zip")])
+        unpacked = sum(info.file_size for info in zipfile.ZipFile(io.BytesIO(data)).infolist())
+        files[f"/{version_hash}-{name}"] = data
+        manifest += [name, hashlib.md5(data).hexdigest(), str(len(data)), str(unpacked)]
+    files[f"/{version_hash}-rbxPkgManifest.txt"] = ("\r\n".join(manifest) + "\r\n").encode()
+
+    history = []
+    for index in range(history_lines - 1):
+        binary_type = "WindowsPlayer" if index % 2 else "Studio64"
+        history.append(
+            f"New {binary_type} version-{index:016x} at {index % 12 + 1}/{index % 28 + 1}/2023 "
+            f"1:00:00 PM, file version: 0, {index // 100}, 0, {index}, git hash: {index:040x} ..."
+        )
+    history.append(
+        f"New WindowsPlayer {version_hash} at 1/1/2024 1:00:00 PM, file version: 0, 999, 0, 9990000, "
+        f"git hash: {0:040x} ..."
+    )
+    files["/DeployHistory.txt"] = ("\r\n".join(history) + "\r\n").encode()
+
+    return files
+
+
+class Throttle:
+    def __init__(self, bandwidth):
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def wait(self, size):
+        if not self.bandwidth:
+            return
+
+        # Shared token bucket, so the limit applies to the whole link
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_free)
+            self.next_free = start + size / self.bandwidth
+
+        delay = self.next_free - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeCDN:
+    def __init__(self, files, latency=0.0, bandwidth=0, failure_rate=0.0, seed=0):
+        self.files = files
+        self.etags = {path: '"%s"' % hashlib.md5(data).hexdigest() for path, data in files.items()}
+        self.latency = latency
+        self.throttle = Throttle(bandwidth)
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handler(self):
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                with cdn.lock:
+                    cdn.requests += 1
+                    failed = cdn.failure_rate and cdn.random.random() < cdn.failure_rate
+
+                if cdn.latency:
+                    time.sleep(cdn.latency)
+
+                path = self.path.split("?")[0]
+                data = cdn.files.get(path)
+
+                if failed:
+                    return self.send_empty(503)
+                if data is None:
+                    return self.send_empty(403)
+
+                etag = cdn.etags[path]
+                if self.headers.get("If-None-Match") == etag:
+                    return self.send_empty(304)
+
+                status, start, end = 200, 0, len(data)
+                range_header = self.headers.get("Range")
+                if range_header and range_header.startswith("bytes="):
+                    first, _, last = range_header[6:].partition("-")
+                    start = int(first)
+                    end = int(last) + 1 if last else len(data)
+                    if start >= len(data):
+                        return self.send_empty(416)
+                    status = 206
+
+                self.send_response(status)
+                self.send_header("Content-Length", str(end - start))
+                self.send_header("ETag", etag)
+                self.send_header("Accept-Ranges", "bytes")
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+                self.end_headers()
+
+                if not send_body:
+                    return
+
+                view = memoryview(data)[start:end]
+                for offset in range(0, len(view), 64 * 1024):
+                    block = view[offset:offset + 64 * 1024]
+                    cdn.throttle.wait(len(block))
+                    try:
+                        self.wfile.write(block)
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    with cdn.lock:
+                        cdn.bytes_sent += len(block)
+
+            def send_empty(self, status):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def point_downloader_at(base_url, mirrors=()):
+    Downloader.CDN_BASE = base_url
+    Downloader.CDN_MIRRORS = list(mirrors)
+    Downloader.DEPLOY_HISTORY_URL = f"{base_url}/DeployHistory.txt"
+
+
+def parse_mirror(value):
+    # "latency:failure_rate", e.g. "0.2:0" for a slow mirror or "0:1" for a dead one
+    latency, _, failure_rate = value.partition(":")
+    return float(latency), float(failure_rate or 0)
+
+
+def run_stage(stage, base_urls, workdir, workers, results):
+    from rich.console import Console
+
+    os.chdir(workdir)
+    point_downloader_at(base_urls[0], base_urls[1:])
+    Downloader.console._console = Console(quiet=True)
+
+    workdir = Path(workdir)
+    zip_path = workdir / "bundle.zip"
+    options = {"workers": workers, "cache": False, "journal": False}
+
+    started = time.perf_counter()
+
+    if stage == "history":
+        shutil.rmtree(workdir / "downloads", ignore_errors=True)
+        Downloader.parse_deploy_history("WindowsPlayer", max_versions=None)
+        size = Downloader.DEPLOY_HISTORY_CACHE.stat().st_size
+    elif stage == "package":
+        Downloader.download_and_package_roblox("WindowsPlayer", VERSION_HASH, zip_path, **options)
+        size = zip_path.stat().st_size
+    elif stage == "extract":
+        target = workdir / "extracted"
+        shutil.rmtree(target, ignore_errors=True)
+        Downloader.extract_zip(zip_path, target)
+        size = sum(info.file_size for info in zipfile.ZipFile(zip_path).infolist())
+    elif stage == "install":
+        target = workdir / "installed"
+        shutil.rmtree(target, ignore_errors=True)
+        Downloader.download_and_install_roblox("WindowsPlayer", VERSION_HASH, target, **options)
+        size = sum(path.stat().st_size for path in target.rglob("*") if path.is_file())
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+    wall = time.perf_counter() - started
+    results.put({
+        "wall_seconds": round(wall, 4),
+        "bytes": size,
+        "throughput_mb_s": round(size / wall / 1024 / 1024, 2) if wall else None,
+        "peak_rss_bytes": peak_rss()
+    })
+
+
+def run_isolated(stage, base_urls, workdir, workers):
+    # Each run gets a fresh process so its peak RSS isn't inflated by earlier stages
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_stage, args=(stage, base_urls, str(workdir), workers, results))
+    process.start()
+    process.join()
+
+    if process.exitcode != 0:
+        raise RuntimeError(f"Stage {stage} failed with exit code {process.exitcode}")
+    return results.get()
+
+
+def run_benchmarks(args):
+    files = build_cdn_files(args.packages, args.package_size, args.files, args.history_lines)
+    cdns = [FakeCDN(files, args.latency, args.bandwidth).start()]
+    cdns += [FakeCDN(files, latency, args.bandwidth, failure_rate).start() for latency, failure_rate in args.mirror]
+    base_urls = [cdn.url for cdn in cdns]
+    workdir = Path(tempfile.mkdtemp(prefix="weao-bench-"))
+
+    report = {
+        "config": {
+            "packages": args.packages,
+            "package_size": args.package_size,
+            "files_per_package": args.files,
+            "history_lines": args.history_lines,
+            "latency": args.latency,
+            "bandwidth": args.bandwidth,
+            "mirrors": [{"latency": latency, "failure_rate": failure_rate} for latency, failure_rate in args.mirror],
+            "workers": args.workers,
+            "repeat": args.repeat,
+            "python": sys.version.split()[0],
+            "platform": sys.platform
+        },
+        "stages": {}
+    }
+
+    try:
+        for stage in args.stages:
+            runs = []
+            for _ in range(args.repeat):
+                if stage == "extract" and not (workdir / "bundle.zip").exists():
+                    run_isolated("package", base_urls, workdir, args.workers)
+                runs.append(run_isolated(stage, base_urls, workdir, args.workers))
+
+            walls = sorted(run["wall_seconds"] for run in runs)
+            report["stages"][stage] = {
+                "runs": runs,
+                "median_wall_seconds": walls[len(walls) // 2],
+                "max_peak_rss_bytes": max(run["peak_rss_bytes"] for run in runs)
+            }
+            print(f"{stage:>8}: {walls[len(walls) // 2]:.3f}s median, "
+                  f"{runs[-1]['throughput_mb_s']} MB/s, "
+                  f"peak RSS {runs[-1]['peak_rss_bytes'] / 1024 / 1024:.1f} MB", file=sys.stderr)
+    finally:
+        for cdn in cdns:
+            cdn.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Downloader.py against a local fake CDN")
+    parser.add_argument("--packages", type=int, default=20)
+    parser.add_argument("--package-size", type=parse_size, default="4M")
+    parser.add_argument("--files", type=int, default=50, help="files per package")
+    parser.add_argument("--history-lines", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument("--bandwidth", type=parse_size, default="0", help="bytes per second, 0 for unlimited")
+    parser.add_argument("--mirror", type=parse_mirror, action="append", default=[], metavar="LATENCY:FAILURE_RATE",
+                        help="serve the same files from an extra mirror, repeat for more")
+    parser.add_argument("--workers", type=int, default=Downloader.DOWNLOAD_WORKERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", type=lambda value: value.split(","), default=STAGES)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()